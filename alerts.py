@@ -0,0 +1,213 @@
+import asyncio
+import bisect
+import os
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+import market_data
+from database import SessionLocal
+from fcm_dispatcher import FCM
+from metrics import Counter, Gauge
+from models import PriceAlert
+
+# ==========================================================
+# 🔔 PER-USER PRICE ALERTS (Sorted threshold indexes)
+# ==========================================================
+# Each instrument keeps two sorted lists of (threshold, alert_id):
+#   _above: fire when price >= threshold   -> crossed rules are a prefix
+#   _below: fire when price <= threshold   -> crossed rules are a suffix
+# so a tick costs two bisects plus the rules that actually fired, however
+# many are armed. "above"/"below" alerts are one-shot; "change_pct" puts
+# one threshold on each side of its reference price and re-arms around the
+# new price after firing.
+#
+# Runs on the market engine leader, hooked into every output rebuild.
+# Alerts created or deleted on any worker reach it through a periodic
+# incremental sync on price_alerts.updated_at. updated_at is stamped before
+# the writer commits, so each sync re-reads ALERT_SYNC_SLACK seconds behind
+# the watermark to catch rows that committed late. Fired one-shot rules
+# leave a tombstone until their persisted (inactive) row has been read, so
+# a stale active copy can't re-arm them.
+#
+# Only prices that are really known are evaluated: PGM codes still on their
+# placeholder defaults are left out of market_data.current_prices().
+
+ALERT_SYNC_SECONDS = float(os.getenv("ALERT_SYNC_SECONDS", "5"))
+ALERT_SYNC_SLACK = timedelta(seconds=float(os.getenv("ALERT_SYNC_SLACK_SECONDS", "60")))
+TOMBSTONE_TTL = timedelta(minutes=30)
+PGM_NAMES = {"pt": "Platinum", "pd": "Palladium", "rh": "Rhodium"}
+
+ALERTS_FIRED = Counter("price_alerts_fired_total", "Per-user price alerts fired", ("kind",))
+
+
+def instrument_names():
+    """Alertable instruments: code/symbol -> display name."""
+    names = dict(PGM_NAMES)
+    names.update({symbol: name for symbol, name, _, _ in market_data.ALL_TICKERS})
+    return names
+
+
+class _Rule:
+    __slots__ = ("id", "user_id", "instrument", "kind", "value", "reference", "updated_at", "above", "below")
+
+    def __init__(self, row):
+        self.id, self.user_id, self.instrument = row.id, row.user_id, row.instrument
+        self.kind, self.value, self.reference, self.updated_at = row.kind, row.value, row.reference, row.updated_at
+        self.above = self.below = None
+        self._arm()
+
+    def _arm(self):
+        if self.kind == "above": self.above = self.value
+        elif self.kind == "below": self.below = self.value
+        elif self.reference:
+            self.above = self.reference * (1 + self.value / 100)
+            self.below = self.reference * (1 - self.value / 100)
+
+
+def _discard(index, threshold, rule_id):
+    i = bisect.bisect_left(index, (threshold, rule_id))
+    if i < len(index) and index[i] == (threshold, rule_id): del index[i]
+
+
+class AlertEngine:
+    def __init__(self):
+        self._rules = {}   # id -> _Rule
+        self._above = {}   # instrument -> sorted [(threshold, id)]
+        self._below = {}
+        self._fired = {}   # one-shot id -> updated_at it was fired at (until the DB shows it)
+        self._watermark = None
+
+    def __len__(self):
+        return len(self._rules)
+
+    # --- Index maintenance ---
+    def _index(self, rule):
+        if rule.above is not None: bisect.insort(self._above.setdefault(rule.instrument, []), (rule.above, rule.id))
+        if rule.below is not None: bisect.insort(self._below.setdefault(rule.instrument, []), (rule.below, rule.id))
+
+    def _unindex(self, rule):
+        if rule.above is not None: _discard(self._above.get(rule.instrument, []), rule.above, rule.id)
+        if rule.below is not None: _discard(self._below.get(rule.instrument, []), rule.below, rule.id)
+
+    def apply_row(self, row):
+        fired_at = self._fired.get(row.id)
+        if fired_at is not None:
+            # Read before our deactivation was persisted: still shows it armed
+            if row.updated_at is None or row.updated_at < fired_at: return
+            del self._fired[row.id]
+        current = self._rules.get(row.id)
+        # The engine's own in-memory changes are newer than a row read before they were persisted;
+        # equal stamps are the same state coming back through the slack window
+        if current is not None and row.updated_at is not None and current.updated_at is not None and row.updated_at <= current.updated_at:
+            return
+        if current is not None:
+            self._unindex(current)
+            del self._rules[row.id]
+        if row.active:
+            rule = _Rule(row)
+            self._rules[rule.id] = rule
+            self._index(rule)
+
+    # --- Evaluation ---
+    def evaluate(self, prices):
+        """Pop every rule crossed by `prices`; returns ([(rule, price)], DB updates)."""
+        fired = []
+        for instrument, price in prices.items():
+            if not price: continue
+            above = self._above.get(instrument)
+            if above:
+                i = bisect.bisect_right(above, (price, float("inf")))
+                if i:
+                    fired.extend((self._rules[rid], price) for _, rid in above[:i])
+                    del above[:i]
+            below = self._below.get(instrument)
+            if below:
+                i = bisect.bisect_left(below, (price, float("-inf")))
+                if i < len(below):
+                    fired.extend((self._rules[rid], price) for _, rid in below[i:])
+                    del below[i:]
+
+        now = datetime.utcnow()
+        changes = []
+        for rule, price in fired:
+            # The other side of a change_pct is still indexed
+            self._unindex(rule)
+            rule.updated_at = now
+            if rule.kind == "change_pct":
+                rule.reference = price
+                rule._arm()
+                self._index(rule)
+                changes.append((rule.id, {"reference": price, "triggered_at": now, "updated_at": now}))
+            else:
+                del self._rules[rule.id]
+                self._fired[rule.id] = now
+                changes.append((rule.id, {"active": False, "triggered_at": now, "updated_at": now}))
+        return fired, changes
+
+    def on_market_update(self):
+        fired, changes = self.evaluate(market_data.current_prices())
+        if not fired: return
+        names = instrument_names()
+        for rule, price in fired:
+            ALERTS_FIRED.inc(rule.kind)
+            FCM.send(*_message(rule, price, names), topic=f"user_{rule.user_id}",
+                     data={"alert_id": str(rule.id), "instrument": rule.instrument, "price": f"{price:.2f}"})
+        # Hooks run on the loop thread; persist in the background
+        asyncio.get_running_loop().run_in_executor(None, _persist, changes)
+
+    # --- Sync with the table ---
+    def sync(self):
+        """Rows changed since the last sync (all active rows on the first call)."""
+        db = SessionLocal()
+        try:
+            if self._watermark is None:
+                self._watermark = db.execute(select(func.max(PriceAlert.updated_at))).scalar() or datetime(1970, 1, 1)
+                return db.execute(select(PriceAlert).where(PriceAlert.active.is_(True))).scalars().all()
+            # Rows stamped before the watermark may have committed after the last read
+            return db.execute(select(PriceAlert).where(PriceAlert.updated_at >= self._watermark - ALERT_SYNC_SLACK)).scalars().all()
+        finally:
+            db.close()
+
+    def _apply_rows(self, rows):
+        for row in rows:
+            self.apply_row(row)
+            if row.updated_at and row.updated_at > self._watermark:
+                self._watermark = row.updated_at
+        # A failed persist never shows up; don't keep its tombstone forever
+        cutoff = datetime.utcnow() - TOMBSTONE_TTL
+        for rule_id in [i for i, at in self._fired.items() if at < cutoff]: del self._fired[rule_id]
+
+    async def run(self):
+        """Initial load, then incremental syncs. Call on the market leader only."""
+        self._apply_rows(await asyncio.to_thread(self.sync))
+        print(f"✅ Price Alerts Loaded ({len(self)} active)")
+        market_data.OUTPUT_HOOKS.append(self.on_market_update)
+        while True:
+            await asyncio.sleep(ALERT_SYNC_SECONDS)
+            try: self._apply_rows(await asyncio.to_thread(self.sync))
+            except Exception as e: print(f"Alert Sync Error: {e}")
+
+
+def _message(rule, price, names):
+    name = names.get(rule.instrument, rule.instrument)
+    if rule.kind == "above": return f"{name} above {rule.value:,.2f}", f"{name} is now {price:,.2f}"
+    if rule.kind == "below": return f"{name} below {rule.value:,.2f}", f"{name} is now {price:,.2f}"
+    return f"{name} moved {rule.value:g}%", f"{name} is now {price:,.2f}"
+
+
+def _persist(changes):
+    db = SessionLocal()
+    try:
+        for alert_id, values in changes:
+            db.execute(update(PriceAlert).where(PriceAlert.id == alert_id).values(**values))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Alert Persist Error: {e}")
+    finally:
+        db.close()
+
+
+ALERTS = AlertEngine()
+Gauge("price_alerts_armed", "Active per-user alert rules on the leader", fn=lambda: {(): len(ALERTS)})
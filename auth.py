@@ -1,12 +1,20 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
-from database import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from database import get_async_db
 from models import UserDB
+from metrics import Counter, Gauge, Histogram
 
 import os
 from dotenv import load_dotenv
@@ -23,24 +31,136 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 def get_password_hash(password): return pwd_context.hash(password)
 def verify_password(plain, hashed): return pwd_context.verify(plain, hashed)
 
+# --- 🔐 PASSWORD HASHING POOL (keeps pbkdf2 off the event loop) ---
+# async endpoints await hash_password_async / verify_password_async instead
+# of hashing inline. At most HASH_WORKERS hashes run at once (hashlib's
+# pbkdf2 releases the GIL, so threads scale across cores); up to
+# HASH_MAX_QUEUE more wait their turn, beyond that callers get a 503.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASH_MAX_QUEUE = int(os.getenv("HASH_MAX_QUEUE", "256"))
+
+HASH_EXECUTOR = ThreadPoolExecutor(max_workers=HASH_WORKERS, thread_name_prefix="pwhash")
+_hash_slots = asyncio.Semaphore(HASH_WORKERS)
+HASH_STATS = {"queued": 0, "running": 0}
+
+HASH_SECONDS = Histogram("password_hash_seconds", "Time per password hash/verify in the pool", ("op",))
+HASH_WAIT_SECONDS = Histogram("password_hash_wait_seconds", "Time spent waiting for a hashing slot", ("op",))
+HASH_REJECTED = Counter("password_hash_rejected_total", "Hash requests refused because the queue was full", ("op",))
+Gauge("password_hash_queue_depth", "Hash requests waiting for a slot", fn=lambda: {(): HASH_STATS["queued"]})
+Gauge("password_hash_in_flight", "Hashes currently running", fn=lambda: {(): HASH_STATS["running"]})
+
+def _timed(op, fn, *args):
+    start = time.perf_counter()
+    try: return fn(*args)
+    finally: HASH_SECONDS.observe(time.perf_counter() - start, op)
+
+async def _run_hash(op, fn, *args):
+    if HASH_STATS["queued"] >= HASH_MAX_QUEUE:
+        HASH_REJECTED.inc(op)
+        raise HTTPException(status_code=503, detail="Server busy, please retry.")
+    HASH_STATS["queued"] += 1
+    waited = time.perf_counter()
+    try:
+        await _hash_slots.acquire()
+    finally:
+        HASH_STATS["queued"] -= 1
+    HASH_WAIT_SECONDS.observe(time.perf_counter() - waited, op)
+    HASH_STATS["running"] += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(HASH_EXECUTOR, _timed, op, fn, *args)
+    finally:
+        HASH_STATS["running"] -= 1
+        _hash_slots.release()
+
+async def hash_password_async(password):
+    return await _run_hash("hash", get_password_hash, password)
+
+async def verify_password_async(plain, hashed):
+    """False (not an exception) for hashes passlib can't identify."""
+    try: return await _run_hash("verify", verify_password, plain, hashed)
+    except ValueError: return False
+
 def create_access_token(data: dict):
     to_encode = data.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+# --- ⚡ AUTH CACHES (decoded claims + slim principals) ---
+# Tokens are cached until min(TTL, exp); principals for AUTH_CACHE_TTL
+# seconds. Writes in this process call invalidate_user(); other workers see
+# a change once their entry expires.
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "10000"))
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "60"))
+
+class TTLCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize, self.ttl = maxsize, ttl
+        self._data = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None: return None
+            if item[0] <= time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return item[1]
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0: return
+        with self._lock:
+            self._data[key] = (time.monotonic() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize: self._data.popitem(last=False)
+
+    def pop(self, key):
+        with self._lock: self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock: self._data.clear()
+
+@dataclass(frozen=True, slots=True)
+class Principal:
+    id: int
+    email: str
+    role: str
+    is_verified: bool
+
+TOKEN_CACHE = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL * 10)   # token -> email
+PRINCIPAL_CACHE = TTLCache(AUTH_CACHE_SIZE, AUTH_CACHE_TTL)    # email -> Principal
+
+def invalidate_user(email):
+    PRINCIPAL_CACHE.pop(email)
+
+def _token_email(token):
+    email = TOKEN_CACHE.get(token)
+    if email is not None: return email
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None: raise HTTPException(status_code=401, detail="Invalid Token")
     except JWTError: raise HTTPException(status_code=401, detail="Invalid Token")
-    
-    user = db.query(UserDB).filter(UserDB.email == email).first()
-    if user is None: raise HTTPException(status_code=401, detail="User not found")
-    return user
+    email = payload.get("sub")
+    if email is None: raise HTTPException(status_code=401, detail="Invalid Token")
+    exp = payload.get("exp")
+    TOKEN_CACHE.set(token, email, ttl=exp - time.time() if exp else None)
+    return email
+
+async def get_current_user(token: str = Depends(oauth2_scheme), db: AsyncSession = Depends(get_async_db)):
+    """Principal for the bearer token. Load the UserDB row by id to modify it."""
+    email = _token_email(token)
+    principal = PRINCIPAL_CACHE.get(email)
+    if principal is not None: return principal
+
+    row = (await db.execute(select(UserDB.id, UserDB.email, UserDB.role, UserDB.is_verified).where(UserDB.email == email))).first()
+    if row is None: raise HTTPException(status_code=401, detail="User not found")
+    principal = Principal(row.id, row.email, row.role, bool(row.is_verified))
+    PRINCIPAL_CACHE.set(email, principal)
+    return principal
 
-async def get_current_admin(current_user: UserDB = Depends(get_current_user)):
+async def get_current_admin(current_user: Principal = Depends(get_current_user)):
     if current_user.role != "admin":
         raise HTTPException(status_code=403, detail="Admin Access Only")
     return current_user
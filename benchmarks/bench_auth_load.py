@@ -0,0 +1,143 @@
+"""Event-loop lag during a signup/login burst.
+
+Fires a burst of concurrent /auth/complete-signup and /auth/change-password
+requests at the app in-process (httpx ASGI transport, no network) while a
+probe task measures how late the event loop wakes it up. Runs once with
+password hashing inline on the loop and once through the auth hashing pool,
+so the two lag profiles can be compared.
+
+    python benchmarks/bench_auth_load.py [--users 50] [--concurrency 10] [--modes inline,pool] [--out results.json]
+
+Concurrency stays under the sync engine's connection pool (5 + 10
+overflow): async endpoints hold their session across awaits, so a wider
+burst exhausts the pool and the loop blocks in checkout.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_DB_DIR = tempfile.mkdtemp(prefix="sbpgm-bench-auth-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}"
+os.environ.setdefault("MARKET_SHARED_STATE", "0")
+
+import httpx  # noqa: E402
+
+import auth  # noqa: E402
+import main  # noqa: E402
+from models import UserDB  # noqa: E402
+
+PROBE_INTERVAL = 0.005
+
+
+async def probe(samples, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append((loop.time() - t0 - PROBE_INTERVAL) * 1000)
+
+
+def seed(prefix, n):
+    db = main.SessionLocal()
+    try:
+        db.add_all(UserDB(email=f"{prefix}{i}@example.com", full_name="Bench", is_verified=True, role="user") for i in range(n))
+        db.commit()
+    finally:
+        db.close()
+
+
+async def _inline(op, fn, *args):
+    return fn(*args)   # the pre-pool behaviour: hash on the event loop
+
+
+def pct(sorted_samples, q):
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * q))]
+
+
+async def run_mode(mode, users, concurrency):
+    original = auth._run_hash
+    if mode == "inline": auth._run_hash = _inline
+    auth._hash_slots = asyncio.Semaphore(auth.HASH_WORKERS)   # fresh loop per run
+    prefix = f"{mode}-"
+    seed(prefix, users)
+    transport = httpx.ASGITransport(app=main.app)
+    samples, stop = [], asyncio.Event()
+    latencies = []
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            slots = asyncio.Semaphore(concurrency)
+
+            async def signup_then_change(i):
+                async with slots: await _signup_then_change(i)
+
+            async def _signup_then_change(i):
+                t0 = time.perf_counter()
+                r = await client.post("/auth/complete-signup", json={"email": f"{prefix}{i}@example.com", "password": "pw-one", "full_name": "Bench"})
+                assert r.status_code == 200, r.text
+                token = r.json()["access_token"]
+                r = await client.post("/auth/change-password", json={"old_password": "pw-one", "new_password": "pw-two"}, headers={"Authorization": f"Bearer {token}"})
+                assert r.status_code == 200, r.text
+                latencies.append((time.perf_counter() - t0) * 1000)
+
+            probe_task = asyncio.create_task(probe(samples, stop))
+            await asyncio.sleep(0.05)
+            t_start = time.perf_counter()
+            await asyncio.gather(*(signup_then_change(i) for i in range(users)))
+            wall = time.perf_counter() - t_start
+            stop.set()
+            await probe_task
+    finally:
+        auth._run_hash = original
+
+    samples.sort()
+    latencies.sort()
+    return {
+        "mode": mode, "users": users, "concurrency": concurrency, "hash_workers": auth.HASH_WORKERS,
+        "wall_s": round(wall, 3),
+        "loop_lag_p50_ms": round(statistics.median(samples), 3),
+        "loop_lag_p99_ms": round(pct(samples, 0.99), 3),
+        "loop_lag_max_ms": round(samples[-1], 3),
+        "request_p50_ms": round(statistics.median(latencies), 3),
+        "request_p99_ms": round(pct(latencies, 0.99), 3),
+    }
+
+
+def git_commit():
+    try: return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception: return None
+
+
+def main_():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=50)
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--modes", default="inline,pool")
+    ap.add_argument("--out", help="write JSON results to this file")
+    args = ap.parse_args()
+
+    results = []
+    for mode in args.modes.split(","):
+        r = asyncio.run(run_mode(mode, args.users, args.concurrency))
+        results.append(r)
+        print(f"[{mode:>6}] lag p50={r['loop_lag_p50_ms']:>8.3f}ms p99={r['loop_lag_p99_ms']:>8.3f}ms max={r['loop_lag_max_ms']:>8.3f}ms  request p50={r['request_p50_ms']:>8.1f}ms wall={r['wall_s']}s", file=sys.stderr)
+
+    report = {"commit": git_commit(), "python": platform.python_version(), "results": results}
+    out = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f: f.write(out)
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main_()
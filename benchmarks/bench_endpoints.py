@@ -0,0 +1,161 @@
+"""Benchmark harness for the pricing, search and live-rates hot paths.
+
+Seeds a throwaway SQLite DB with synthetic ConverterDB catalogs, stubs the
+market CACHE with fixed prices, drives the FastAPI app in-process (no
+startup hooks, so no scrapers / Firebase / network) and reports p50/p99
+latency, requests/second and peak allocations per request for each case.
+
+    python benchmarks/bench_endpoints.py [--sizes 1000,10000,100000] [--requests 200] [--out results.json]
+
+Output is JSON (stdout or --out) tagged with the git commit, so runs can be
+diffed across commits.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Must be set before the app modules create their engine
+_DB_DIR = tempfile.mkdtemp(prefix="sbpgm-bench-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_DB_DIR, 'bench.db')}"
+os.environ.setdefault("MARKET_SHARED_STATE", "0")
+
+from fastapi.testclient import TestClient  # noqa: E402
+from sqlalchemy import delete, insert  # noqa: E402
+
+import main  # noqa: E402
+import market_data  # noqa: E402
+from catalog_index import CATALOG, CATALOG_COLUMNS  # noqa: E402
+from config_cache import CONFIG  # noqa: E402
+from models import AppConfig, ConverterDB  # noqa: E402
+
+BRANDS = ["Toyota", "Honda", "BMW", "Ford", "Hyundai", "Suzuki", "Mercedes", "Nissan", "Kia", "Tata"]
+FIXED_PGM = {"pt": 960.0, "pd": 1050.0, "rh": 4750.0}
+FIXED_TICKERS = {"Gold (Spot)": 2400.0, "Bitcoin": 65000.0, "USD / INR": 86.5, "Crude Oil (WTI)": 78.0}
+
+
+def seed_catalog(size):
+    rnd = random.Random(size)
+    db = main.SessionLocal()
+    try:
+        db.execute(delete(ConverterDB))
+        rows = [{
+            "serial": f"{rnd.choice('ABCDEFGHKMNPRSTVWXYZ')}{rnd.choice('ABCDEFGHKMNPRSTVWXYZ')}-{i:06d}",
+            "brand": rnd.choice(BRANDS), "description": "", "image": f"https://img.example/{i}.jpg",
+            "weight_kg": round(rnd.uniform(0.5, 3.0), 3),
+            "pt_ppm": round(rnd.uniform(0, 2500), 1), "pd_ppm": round(rnd.uniform(0, 4000), 1), "rh_ppm": round(rnd.uniform(0, 600), 1),
+        } for i in range(size)]
+        for i in range(0, size, 5000): db.execute(insert(ConverterDB), rows[i:i + 5000])
+        if not db.query(AppConfig).first(): db.add(AppConfig(id=1))
+        db.commit()
+        CONFIG.set_from_row(db.query(AppConfig).first())
+        CATALOG.load(db.query(*[getattr(ConverterDB, c) for c in CATALOG_COLUMNS]).yield_per(1000))
+    finally:
+        db.close()
+
+
+def stub_market():
+    market_data.CACHE["pgm_prices"] = dict(FIXED_PGM)
+    market_data.OPENING_PRICES.update(FIXED_PGM)
+    for name, price in FIXED_TICKERS.items():
+        market_data.REAL_DATA_CACHE[name] = {"price": price, "change": 0.0, "percent": 0.0}
+    market_data.build_output()
+
+
+def measure(name, fn, n):
+    fn()  # warm-up
+    samples = []
+    t_start = time.perf_counter()
+    for _ in range(n):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    wall = time.perf_counter() - t_start
+
+    # Separate pass so tracing overhead doesn't skew latency
+    tracemalloc.start()
+    peaks = []
+    for _ in range(min(n, 20)):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        fn()
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    tracemalloc.stop()
+
+    samples.sort()
+    return {
+        "case": name, "requests": n,
+        "p50_ms": round(statistics.median(samples), 3),
+        "p99_ms": round(samples[max(0, int(len(samples) * 0.99) - 1)], 3),
+        "rps": round(n / wall, 1),
+        "alloc_peak_kb": round(statistics.median(peaks) / 1024, 1),
+    }
+
+
+def run_size(client, size, n):
+    seed_catalog(size)
+    heavy = max(3, min(n, n * 1000 // size))   # full-catalog responses get fewer iterations
+    etag = client.get("/live_rates").headers["etag"]
+
+    def ok(resp):
+        assert resp.status_code in (200, 304), resp.status_code
+        return resp
+
+    cases = [
+        ("calculate_payout_logic", lambda: main.calculate_payout_logic(1.2, 1500, 2500, 300, "USD"), n),
+        ("POST /calculate", lambda: ok(client.post("/calculate", json={"weight": 1.2, "pt_ppm": 1500, "pd_ppm": 2500, "rh_ppm": 300})), n),
+        ("GET /converters/search?q=toy", lambda: ok(client.get("/converters/search", params={"q": "toy"})), heavy),
+        ("GET /converters/search?q=AB-00", lambda: ok(client.get("/converters/search", params={"q": "AB-00"})), n),
+        ("GET /converters/search?q=&limit=50", lambda: ok(client.get("/converters/search", params={"limit": 50})), n),
+        ("GET /converters/search?q=", lambda: ok(client.get("/converters/search")), heavy),
+        ("GET /live_rates", lambda: ok(client.get("/live_rates")), n),
+        ("GET /live_rates (304)", lambda: ok(client.get("/live_rates", headers={"If-None-Match": etag})), n),
+        ("market_data.build_output", market_data.build_output, n),
+    ]
+    results = []
+    for name, fn, count in cases:
+        r = measure(name, fn, count)
+        r["catalog_size"] = size
+        results.append(r)
+        print(f"[{size:>6}] {name:<36} p50={r['p50_ms']:>9.3f}ms p99={r['p99_ms']:>9.3f}ms rps={r['rps']:>9.1f} alloc={r['alloc_peak_kb']:>9.1f}KB", file=sys.stderr)
+    return results
+
+
+def git_commit():
+    try: return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception: return None
+
+
+def main_():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--sizes", default="1000,10000,100000")
+    ap.add_argument("--requests", type=int, default=200)
+    ap.add_argument("--out", help="write JSON results to this file")
+    args = ap.parse_args()
+
+    stub_market()
+    client = TestClient(main.app)
+    results = []
+    for size in (int(s) for s in args.sizes.split(",")):
+        results.extend(run_size(client, size, args.requests))
+
+    report = {"commit": git_commit(), "python": platform.python_version(), "results": results}
+    out = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f: f.write(out)
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main_()
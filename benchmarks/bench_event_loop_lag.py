@@ -0,0 +1,193 @@
+"""Event-loop lag during an OTP burst: sync sessions vs the async engine.
+
+Fires concurrent /auth/send-otp + /auth/verify-otp pairs at the app
+in-process (httpx ASGI transport, no network) while a probe task measures
+how late the event loop wakes it up. Every SQLite statement is slowed by
+--db-latency-ms inside the driver, standing in for a network round trip to
+Postgres. Two modes:
+
+    sync   the pre-async behaviour: the endpoints get a plain Session and
+           every query blocks the event loop for its full round trip
+    async  the endpoints' real dependency (aiosqlite): the wait happens in
+           the driver's thread and the loop keeps serving
+
+    python benchmarks/bench_event_loop_lag.py [--users 200] [--concurrency 50] [--db-latency-ms 5] [--modes sync,async] [--out results.json]
+
+Email delivery is stubbed out so only the DB path is measured. In sync
+mode the probe may only get a handful of samples: a loop that never yields
+can't wake it, and the max lag is roughly the whole burst.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_DB_DIR = tempfile.mkdtemp(prefix="sbpgm-bench-lag-")
+_DB_PATH = os.path.join(_DB_DIR, "bench.db")
+os.environ["DATABASE_URL"] = f"sqlite:///{_DB_PATH}"
+os.environ.setdefault("MARKET_SHARED_STATE", "0")
+os.environ["OTP_IP_LIMIT"] = "1000000"   # every request comes from one ASGI client
+
+import httpx  # noqa: E402
+from sqlalchemy import create_engine  # noqa: E402
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+import database  # noqa: E402
+import main  # noqa: E402
+
+PROBE_INTERVAL = 0.005
+FIXED_OTP = "123456"
+DB_LATENCY = 0.005
+
+
+class SlowCursor(sqlite3.Cursor):
+    def execute(self, *args):
+        time.sleep(DB_LATENCY)   # runs on whichever thread drives the driver
+        return super().execute(*args)
+
+
+class SlowConnection(sqlite3.Connection):
+    def cursor(self, factory=SlowCursor):
+        return super().cursor(factory)
+
+
+class SyncSessionShim:
+    """AsyncSession surface over a sync Session: awaits that never yield."""
+
+    def __init__(self, session):
+        self._s = session
+
+    def add(self, obj): self._s.add(obj)
+    async def execute(self, stmt): return self._s.execute(stmt)
+    async def scalar(self, stmt): return self._s.scalar(stmt)
+    async def get(self, cls, ident): return self._s.get(cls, ident)
+    async def commit(self): self._s.commit()
+
+
+def session_dependency(mode):
+    connect_args = {"factory": SlowConnection, "check_same_thread": False}
+    if mode == "sync":
+        factory = sessionmaker(bind=create_engine(database.DATABASE_URL, connect_args=connect_args), autoflush=False, expire_on_commit=False)
+
+        async def dep():
+            db = factory()
+            try: yield SyncSessionShim(db)
+            finally: db.close()
+        return dep, None
+
+    engine = create_async_engine(database.ASYNC_DATABASE_URL, connect_args=connect_args)
+    factory = async_sessionmaker(engine, autoflush=False, expire_on_commit=False)
+
+    async def dep():
+        async with factory() as db: yield db
+    return dep, engine
+
+
+async def probe(samples, stop):
+    loop = asyncio.get_running_loop()
+    while not stop.is_set():
+        t0 = loop.time()
+        await asyncio.sleep(PROBE_INTERVAL)
+        samples.append((loop.time() - t0 - PROBE_INTERVAL) * 1000)
+
+
+async def _no_email(email, otp):
+    return None
+
+
+def pct(sorted_samples, q):
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * q))]
+
+
+async def run_mode(mode, users, concurrency):
+    dep, engine = session_dependency(mode)
+    main.app.dependency_overrides[main.get_async_db] = dep
+    originals = main.generate_otp, main.send_otp_email
+    main.generate_otp, main.send_otp_email = (lambda: FIXED_OTP), _no_email
+    prefix = f"{mode}-"
+    transport = httpx.ASGITransport(app=main.app)
+    samples, stop = [], asyncio.Event()
+    latencies = []
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            slots = asyncio.Semaphore(concurrency)
+
+            async def otp_flow(i):
+                async with slots:
+                    email = f"{prefix}{i}@example.com"
+                    t0 = time.perf_counter()
+                    r = await client.post("/auth/send-otp", params={"email": email})
+                    assert r.status_code == 200, r.text
+                    r = await client.post("/auth/verify-otp", json={"email": email, "otp": FIXED_OTP})
+                    assert r.status_code == 200, r.text
+                    latencies.append((time.perf_counter() - t0) * 1000)
+
+            probe_task = asyncio.create_task(probe(samples, stop))
+            await asyncio.sleep(0.05)
+            t_start = time.perf_counter()
+            await asyncio.gather(*(otp_flow(i) for i in range(users)))
+            wall = time.perf_counter() - t_start
+            stop.set()
+            await probe_task
+    finally:
+        main.generate_otp, main.send_otp_email = originals
+        main.app.dependency_overrides.pop(main.get_async_db, None)
+        if engine is not None: await engine.dispose()
+
+    samples.sort()
+    latencies.sort()
+    return {
+        "mode": mode, "users": users, "concurrency": concurrency, "db_latency_ms": DB_LATENCY * 1000,
+        "wall_s": round(wall, 3), "probe_samples": len(samples),
+        "loop_lag_p50_ms": round(statistics.median(samples), 3),
+        "loop_lag_p99_ms": round(pct(samples, 0.99), 3),
+        "loop_lag_max_ms": round(samples[-1], 3),
+        "request_p50_ms": round(statistics.median(latencies), 3),
+        "request_p99_ms": round(pct(latencies, 0.99), 3),
+    }
+
+
+def git_commit():
+    try: return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception: return None
+
+
+def main_():
+    global DB_LATENCY
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--users", type=int, default=200)
+    ap.add_argument("--concurrency", type=int, default=50)
+    ap.add_argument("--db-latency-ms", type=float, default=5.0)
+    ap.add_argument("--modes", default="sync,async")
+    ap.add_argument("--out", help="write JSON results to this file")
+    args = ap.parse_args()
+    DB_LATENCY = args.db_latency_ms / 1000
+
+    main.Base.metadata.create_all(bind=main.engine)
+    results = []
+    for mode in args.modes.split(","):
+        r = asyncio.run(run_mode(mode, args.users, args.concurrency))
+        results.append(r)
+        print(f"[{mode:>5}] lag p50={r['loop_lag_p50_ms']:>8.3f}ms p99={r['loop_lag_p99_ms']:>8.3f}ms max={r['loop_lag_max_ms']:>8.3f}ms  request p50={r['request_p50_ms']:>8.1f}ms p99={r['request_p99_ms']:>8.1f}ms wall={r['wall_s']}s", file=sys.stderr)
+
+    report = {"commit": git_commit(), "python": platform.python_version(), "results": results}
+    out = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f: f.write(out)
+    else:
+        print(out)
+
+
+if __name__ == "__main__":
+    main_()
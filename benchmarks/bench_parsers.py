@@ -0,0 +1,79 @@
+"""Micro-benchmark: price extraction from saved Kitco / backup pages.
+
+Compares the targeted regex extractors, the strained soup fallback and the
+original full `html.parser` soup over the HTML fixtures in ./fixtures.
+
+    python benchmarks/bench_parsers.py [--iterations 50] [--json]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import price_parsers  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def original_parse(html, source_type):
+    # Baseline: the pre-extraction-layer logic from market_data._fetch_html
+    soup = BeautifulSoup(html, "html.parser")
+    price_str = ""
+    if source_type == "kitco":
+        tag = soup.find("h3", class_=lambda c: c and "font-mulish" in c and "text-4xl" in c)
+        if tag: price_str = tag.get_text()
+    elif source_type == "backup":
+        tag = soup.find("td", {"id": "spot-price"})
+        if tag: price_str = tag.get_text()
+    return price_parsers.to_price(price_str)
+
+
+def _time(fn, html, source_type, iterations):
+    samples = []
+    result = None
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        result = fn(html, source_type)
+        samples.append((time.perf_counter() - t0) * 1000)
+    return result, samples
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--iterations", type=int, default=50)
+    ap.add_argument("--json", action="store_true", help="machine-readable output")
+    args = ap.parse_args()
+
+    variants = {
+        "regex": lambda html, st: price_parsers.to_price(price_parsers.EXTRACTORS[st][0](html)),
+        f"soup_strained[{price_parsers.SOUP_PARSER}]": lambda html, st: price_parsers.to_price(price_parsers.EXTRACTORS[st][-1](html)),
+        "soup_full[html.parser]": original_parse,
+    }
+
+    results = []
+    for source_type, fname in (("kitco", "kitco.html"), ("backup", "backup.html")):
+        with open(os.path.join(FIXTURES, fname), encoding="utf-8") as f:
+            html = f.read()
+        for name, fn in variants.items():
+            price, samples = _time(fn, html, source_type, args.iterations)
+            results.append({
+                "fixture": fname, "bytes": len(html), "variant": name, "price": price,
+                "p50_ms": round(statistics.median(samples), 3),
+                "p99_ms": round(sorted(samples)[int(len(samples) * 0.99) - 1], 3),
+            })
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['fixture']:<12} {r['variant']:<26} price={r['price']!s:<9} p50={r['p50_ms']:>8.3f}ms p99={r['p99_ms']:>8.3f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""Benchmark: legacy 2d/1m Yahoo bars vs the quote fetch mode.
+
+Drives the real fetch functions (market_data.fetch_yahoo_batch and
+yahoo_quotes.fetch_yahoo_quotes) through yfinance, with its HTTP session
+pointed at a local stub that replays chart-API responses (v8 `chart` JSON,
+gzipped like Yahoo serves them). Measures, per fetch cycle over all
+tickers: chart requests, bytes on the wire and after decompression, wall
+time (untraced run) and peak memory (traced run). Runs fully offline.
+
+Responses are generated deterministically in the recorded format rather
+than committed, so the 2-day 1-minute case doesn't add megabytes of
+fixtures to the repo. The stub runs in its own process and is warmed
+before measuring, so building responses stays out of both the timings and
+the tracemalloc window.
+
+    python benchmarks/bench_yahoo.py [--tickers 43] [--cycles 5] [--json]
+"""
+import argparse
+import gzip
+import json
+import multiprocessing
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pandas as pd
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+_TMP_DIR = tempfile.mkdtemp(prefix="sbpgm-bench-yahoo-")
+os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(_TMP_DIR, 'bench.db')}"
+
+import yfinance  # noqa: E402
+import yfinance.multi  # noqa: E402
+
+import market_data  # noqa: E402
+import yahoo_quotes  # noqa: E402
+
+EXCHANGE_TZ = "America/New_York"
+SESSION_MINUTES = 1380   # 24h futures/forex sessions for the worst case
+DAY = 86400
+
+
+# ---------------------------------------------------------------- stub server
+
+def chart_response(symbol, timestamps, granularity):
+    rnd = random.Random(symbol)
+    px = 100 + rnd.random() * 50
+    closes = []
+    for _ in timestamps:
+        px *= 1 + rnd.uniform(-0.0005, 0.0005)
+        closes.append(round(px, 4))
+    tz = {"timezone": "EDT", "gmtoffset": -14400}
+    last = timestamps[-1]
+    meta = {"currency": "USD", "symbol": symbol, "exchangeName": "NYM", "fullExchangeName": "New York Mercantile Exchange",
+            "instrumentType": "FUTURE", "firstTradeDate": 967003200, "regularMarketTime": last,
+            "hasPrePostMarketData": False, "exchangeTimezoneName": EXCHANGE_TZ, **tz,
+            "regularMarketPrice": closes[-1], "chartPreviousClose": closes[0], "priceHint": 2,
+            "currentTradingPeriod": {"pre": {**tz, "start": last, "end": last},
+                                     "regular": {**tz, "start": last, "end": last + DAY},
+                                     "post": {**tz, "start": last + DAY, "end": last + DAY}},
+            "dataGranularity": granularity, "range": "",
+            "validRanges": ["1d", "5d", "1mo", "3mo", "6mo", "1y", "2y", "5y", "10y", "ytd", "max"]}
+    indicators = {"quote": [{"open": closes, "high": closes, "low": closes, "close": closes,
+                             "volume": [rnd.randint(0, 500) for _ in timestamps]}]}
+    if granularity == "1d":
+        indicators["adjclose"] = [{"adjclose": closes}]
+    else:
+        days = sorted({t - t % DAY for t in timestamps})
+        meta["tradingPeriods"] = [[{**tz, "start": d, "end": d + DAY}] for d in days]
+    return {"chart": {"result": [{"meta": meta, "timestamp": timestamps, "indicators": indicators}], "error": None}}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    now = 0
+    cache = {}
+
+    def _timestamps(self, q):
+        interval = q["interval"][0]
+        if interval == "1d":
+            days = int(q.get("range", ["5d"])[0].rstrip("d"))
+            midnight = self.now - self.now % DAY
+            return [midnight - (days - 1 - i) * DAY + 4 * 3600 for i in range(days)]
+        if "range" in q:
+            n = int(q["range"][0].rstrip("d")) * SESSION_MINUTES
+        else:
+            start, end = int(q["period1"][0]), min(int(q["period2"][0]), self.now)
+            n = max(1, (end - start) // 60 + 1)
+        return [self.now - (n - 1 - i) * 60 for i in range(n)]
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.endswith("/getcrumb"):
+            return self._send(b"benchcrumb", "text/plain")
+        if "/v8/finance/chart/" not in url.path:
+            return self._send(b"", "text/html", cookie="A3=bench; Domain=127.0.0.1; Path=/")
+        q = parse_qs(url.query)
+        symbol = url.path.rsplit("/", 1)[-1]
+        ts = self._timestamps(q)
+        key = (symbol, q["interval"][0], ts[0], len(ts))
+        if key not in self.cache:
+            self.cache[key] = gzip.compress(json.dumps(chart_response(symbol, ts, q["interval"][0]), separators=(",", ":")).encode())
+        self._send(self.cache[key], "application/json", gzipped=True)
+
+    def _send(self, body, content_type, gzipped=False, cookie=None):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        if gzipped: self.send_header("Content-Encoding", "gzip")
+        if cookie: self.send_header("Set-Cookie", cookie)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def _serve(port_queue, now):
+    _StubHandler.now = now
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StubHandler)
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+class StubSession(requests.Session):
+    """Routes Yahoo hosts to the stub and counts chart-API traffic."""
+
+    def __init__(self, base):
+        super().__init__()
+        self.base = base
+        self.reset()
+
+    def reset(self):
+        self.calls = self.wire_bytes = self.body_bytes = 0
+
+    def request(self, method, url, *args, **kwargs):
+        parts = urlsplit(url)
+        if parts.hostname and parts.hostname.endswith("yahoo.com"):
+            url = self.base + (parts.path or "/") + (f"?{parts.query}" if parts.query else "")
+        resp = super().request(method, url, *args, **kwargs)
+        if "/v8/finance/chart/" in url:
+            self.calls += 1
+            self.wire_bytes += int(resp.headers.get("Content-Length", 0))
+            self.body_bytes += len(resp.content)
+        return resp
+
+
+# ---------------------------------------------------------------- cases
+
+def quote_cold(symbols):
+    yahoo_quotes.YAHOO_STATE.clear()
+    return yahoo_quotes.fetch_yahoo_quotes(symbols)
+
+
+def quote_steady(symbols):
+    # Reference already taken today, last bar seen a minute ago
+    last = pd.Timestamp(datetime.now(timezone.utc)).floor("min") - pd.Timedelta(minutes=1)
+    for st in yahoo_quotes.YAHOO_STATE.values(): st["last_ts"] = last
+    return yahoo_quotes.fetch_yahoo_quotes(symbols)
+
+
+CASES = [
+    ("bars", market_data.fetch_yahoo_batch),
+    ("quote_reference", quote_cold),
+    ("quote_increment", quote_steady),
+]
+
+
+def run_cycle(session, name, fn, symbols):
+    # Timed without tracemalloc (it slows allocation-heavy code), then traced for peak memory
+    session.reset()
+    t0 = time.perf_counter()
+    res = fn(symbols)
+    wall = time.perf_counter() - t0
+    assert len(res) == len(symbols), f"{name}: {len(res)}/{len(symbols)} tickers"
+    traffic = {"calls": session.calls, "wire_bytes": session.wire_bytes, "body_bytes": session.body_bytes}
+    tracemalloc.start()
+    fn(symbols)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"case": name, **traffic, "ms": wall * 1000, "peak_kb": peak / 1024}
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--tickers", type=int, default=43, help="number of Yahoo tickers per cycle")
+    ap.add_argument("--cycles", type=int, default=5, help="measured cycles per case (median reported)")
+    ap.add_argument("--json", action="store_true", help="machine-readable output")
+    args = ap.parse_args()
+
+    now = int(time.time()) // 60 * 60
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=_serve, args=(ports, now), daemon=True)
+    server.start()
+    session = StubSession(f"http://127.0.0.1:{ports.get(timeout=10)}")
+    yfinance.set_tz_cache_location(_TMP_DIR)
+    # yf.download builds a fresh session per call unless handed one
+    original = yfinance.multi.new_session
+    yfinance.multi.new_session = lambda: session
+
+    symbols = [f"T{i:02d}" for i in range(args.tickers)]
+    results = []
+    try:
+        for name, fn in CASES:
+            run_cycle(session, name, fn, symbols)   # warm the stub's response cache and yfinance's tz cache
+            runs = [run_cycle(session, name, fn, symbols) for _ in range(args.cycles)]
+            results.append({**runs[0], "ms": round(statistics.median(r["ms"] for r in runs), 2),
+                            "peak_kb": round(statistics.median(r["peak_kb"] for r in runs), 1)})
+    finally:
+        yfinance.multi.new_session = original
+        server.terminate()
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for r in results:
+        print(f"{r['case']:<16} calls={r['calls']:>3} wire={r['wire_bytes']:>10,}B body={r['body_bytes']:>11,}B "
+              f"wall={r['ms']:>8.2f}ms peak={r['peak_kb']:>9.1f}KB")
+    print("quote mode steady state = quote_increment per cycle; quote_reference once per UTC day")
+
+
+if __name__ == "__main__":
+    main()
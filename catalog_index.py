@@ -0,0 +1,190 @@
+import asyncio
+import bisect
+import os
+import threading
+from collections import defaultdict
+
+from sqlalchemy import func, select, update
+
+from database import SessionLocal
+from models import AppConfig, ConverterDB
+
+# ==========================================================
+# 🔍 IN-MEMORY CONVERTER CATALOG INDEX (n-gram substring search)
+# ==========================================================
+# Leading-wildcard ILIKE can't use the serial/brand indexes, so search is
+# served from a process-local n-gram index. Each process loads it at
+# startup and applies its own admin writes directly. Every catalog write also
+# bumps app_config.catalog_version in the same transaction; other workers
+# poll it every CATALOG_POLL_SECONDS and reload when it moves.
+
+MAX_GRAM = 3
+CATALOG_POLL_SECONDS = float(os.getenv("CATALOG_POLL_SECONDS", "5"))
+
+# Row shape shared by the index and the DB fallback query
+CATALOG_COLUMNS = ("id", "serial", "brand", "image", "weight_kg", "pt_ppm", "pd_ppm", "rh_ppm", "image_thumb", "image_medium")
+
+# Ranking tiers (lower is better)
+RANK_EXACT, RANK_PREFIX, RANK_SUBSTRING = 0, 1, 2
+
+
+def bump_catalog_version(db):
+    """Bump the catalog generation inside the caller's transaction; returns the new value."""
+    db.execute(update(AppConfig).values(catalog_version=func.coalesce(AppConfig.catalog_version, 0) + 1))
+    return db.execute(select(AppConfig.catalog_version)).scalar()
+
+
+def _grams(text):
+    grams = set()
+    for n in range(1, MAX_GRAM + 1):
+        for i in range(len(text) - n + 1):
+            grams.add(text[i:i + n])
+    return grams
+
+
+def _rank(needle, text):
+    if text == needle: return RANK_EXACT
+    if text.startswith(needle): return RANK_PREFIX
+    return RANK_SUBSTRING
+
+
+class CatalogIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows = {}                     # id -> row tuple (CATALOG_COLUMNS order)
+        self._keys = {}                     # id -> (serial_lower, brand_lower)
+        self._by_serial = {}                # serial -> id
+        self._postings = defaultdict(set)   # gram -> {id}
+        self._all_sorted = None             # cached full listing for empty queries
+        self._all_ids = None                # cached sorted ids for id-keyed pages
+        self.version = None                 # catalog_version the index reflects
+        self.ready = False
+
+    def _advance(self, version):
+        # Only our own write followed what we've seen; anything else waits for the poll
+        if version is not None and self.version is not None and version == self.version + 1:
+            self.version = version
+
+    def _add(self, row):
+        row_id, serial, brand = row[0], row[1], row[2]
+        self._all_sorted = None; self._all_ids = None
+        if row_id in self._rows: self._remove(row_id)
+        keys = ((serial or "").lower(), (brand or "").lower())
+        self._rows[row_id] = tuple(row)
+        self._keys[row_id] = keys
+        self._by_serial[serial] = row_id
+        for g in _grams(keys[0]) | _grams(keys[1]):
+            self._postings[g].add(row_id)
+
+    def _remove(self, row_id):
+        row = self._rows.pop(row_id, None)
+        if row is None: return
+        self._all_sorted = None; self._all_ids = None
+        keys = self._keys.pop(row_id)
+        self._by_serial.pop(row[1], None)
+        for g in _grams(keys[0]) | _grams(keys[1]):
+            ids = self._postings.get(g)
+            if ids is None: continue
+            ids.discard(row_id)
+            if not ids: del self._postings[g]
+
+    def load(self, rows, version=None):
+        # Build aside and swap, so searches keep being served during a reload
+        fresh = CatalogIndex()
+        for row in rows: fresh._add(row)
+        with self._lock:
+            self._rows, self._keys, self._by_serial, self._postings = fresh._rows, fresh._keys, fresh._by_serial, fresh._postings
+            self._all_sorted = None; self._all_ids = None
+            self.version = version
+            self.ready = True
+        print(f"✅ Catalog Index Loaded ({len(self._rows)} converters, v{version})")
+
+    def load_from_db(self, db):
+        # Version first: a write landing in between just triggers another reload
+        version = db.query(AppConfig.catalog_version).scalar()
+        self.load(db.query(*[getattr(ConverterDB, c) for c in CATALOG_COLUMNS]).yield_per(1000), version)
+
+    def upsert(self, row, version=None):
+        with self._lock:
+            self._add(row)
+            self._advance(version)
+
+    def remove_serial(self, serial, version=None):
+        with self._lock:
+            row_id = self._by_serial.get(serial)
+            if row_id is not None: self._remove(row_id)
+            self._advance(version)
+
+    def _poll(self):
+        db = SessionLocal()
+        try:
+            if db.query(AppConfig.catalog_version).scalar() != self.version: self.load_from_db(db)
+        finally:
+            db.close()
+
+    async def watch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(CATALOG_POLL_SECONDS)
+            try: await loop.run_in_executor(None, self._poll)
+            except Exception as e: print(f"Catalog Poll Error: {e}")
+
+    def _candidates(self, needle):
+        if len(needle) <= MAX_GRAM:
+            return set(self._postings.get(needle, ()))
+        # Intersect postings of every MAX_GRAM window, rarest first
+        postings = sorted((self._postings.get(needle[i:i + MAX_GRAM], set()) for i in range(len(needle) - MAX_GRAM + 1)), key=len)
+        result = set(postings[0])
+        for p in postings[1:]:
+            result &= p
+            if not result: break
+        return result
+
+    def search(self, q):
+        """Return rows matching `q` in serial or brand, best matches first.
+
+        Serial hits rank ahead of brand hits; within each, exact > prefix >
+        substring, then by serial.
+        """
+        needle = q.lower()
+        with self._lock:
+            if not needle:
+                if self._all_sorted is None:
+                    self._all_sorted = sorted(self._rows.values(), key=lambda r: r[1] or "")
+                return self._all_sorted
+            ranked = []
+            for row_id in self._candidates(needle):
+                serial_key, brand_key = self._keys[row_id]
+                # n-gram intersection can yield false positives for long needles
+                if needle in serial_key: rank = _rank(needle, serial_key)
+                elif needle in brand_key: rank = 3 + _rank(needle, brand_key)
+                else: continue
+                ranked.append((rank, serial_key, self._rows[row_id]))
+        ranked.sort(key=lambda t: (t[0], t[1]))
+        return [r for _, _, r in ranked]
+
+    def page(self, q, after_id=None, limit=None):
+        """Return matches in `ConverterDB.id` order, starting after `after_id`.
+
+        Keyset pages don't shift when converters are added or removed, which
+        ranked order can't guarantee, so paginated callers get id order.
+        """
+        needle = q.lower()
+        with self._lock:
+            if not needle:
+                if self._all_ids is None: self._all_ids = sorted(self._rows)
+                ids = self._all_ids
+            else:
+                ids = sorted(
+                    row_id for row_id in self._candidates(needle)
+                    if needle in self._keys[row_id][0] or needle in self._keys[row_id][1]
+                )
+            start = bisect.bisect_right(ids, after_id) if after_id is not None else 0
+            end = start + limit if limit is not None else len(ids)
+            return [self._rows[row_id] for row_id in ids[start:end]]
+
+    def __len__(self):
+        return len(self._rows)
+
+
+CATALOG = CatalogIndex()
@@ -0,0 +1,220 @@
+import csv
+import io
+import json
+import os
+import sys
+
+from pydantic import ValidationError
+from sqlalchemy import and_, case, delete, func, insert, select
+
+from catalog_index import CATALOG, CATALOG_COLUMNS, bump_catalog_version
+from database import SessionLocal, engine
+from models import ConverterDB
+from schemas import NewConverter
+
+# ==========================================================
+# 📦 BULK CONVERTER IMPORT / EXPORT (CSV + JSONL)
+# ==========================================================
+# Rows are streamed from the file, validated against the NewConverter shape
+# and upserted on `serial` in batches (one executemany per batch instead of
+# a commit per row). Bad rows are reported with their line number and
+# skipped; the rest of the batch still lands. A blank or missing image /
+# description keeps the stored value, and a new image clears the WebP
+# variants built from the old one. Export streams the table in
+# id order with yield_per, so the catalog is never held in memory at once.
+#
+#   python catalog_io.py import suppliers.csv
+#   python catalog_io.py export catalog.jsonl
+
+IMPORT_BATCH_SIZE = int(os.getenv("CATALOG_IMPORT_BATCH", "1000"))
+EXPORT_CHUNK = 1000
+MAX_REPORTED_ERRORS = 500
+
+FIELDS = list(NewConverter.model_fields)
+# Optional in bulk files (blank = keep the stored value); everything else is required
+FIELD_DEFAULTS = {"description": "", "image": ""}
+VARIANT_COLUMNS = ("image_thumb", "image_medium")
+
+
+def detect_format(filename, fmt=None):
+    if fmt: return fmt.lower()
+    return "jsonl" if (filename or "").lower().endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def _records(text_stream, fmt):
+    """Yield (line_no, dict) per input record, or (line_no, error str)."""
+    if fmt == "jsonl":
+        for line_no, line in enumerate(text_stream, 1):
+            if not line.strip(): continue
+            try:
+                rec = json.loads(line)
+            except ValueError as e:
+                yield line_no, f"invalid JSON: {e}"
+                continue
+            yield line_no, rec if isinstance(rec, dict) else "expected a JSON object"
+    elif fmt == "csv":
+        reader = csv.DictReader(text_stream)
+        for rec in reader:
+            yield reader.line_num, {k.strip(): v for k, v in rec.items() if k}
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def _validate(rec):
+    data = {**FIELD_DEFAULTS, **{k: v for k, v in rec.items() if k in FIELDS and v not in (None, "")}}
+    conv = NewConverter(**data)
+    if not conv.serial.strip(): raise ValueError("serial is empty")
+    row = conv.model_dump()
+    row["serial"] = row["serial"].strip()
+    return row
+
+
+def _upsert_stmt():
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    stmt = dialect_insert(ConverterDB)
+    ex = stmt.excluded
+    set_ = {f: getattr(ex, f) for f in FIELDS if f != "serial" and f not in FIELD_DEFAULTS}
+    for f in FIELD_DEFAULTS:
+        set_[f] = func.coalesce(func.nullif(getattr(ex, f), ""), getattr(ConverterDB, f))
+    image_changed = and_(ex.image != "", ConverterDB.image.is_distinct_from(ex.image))
+    for v in VARIANT_COLUMNS:
+        set_[v] = case((image_changed, None), else_=getattr(ConverterDB, v))
+    return stmt.on_conflict_do_update(index_elements=[ConverterDB.serial], set_=set_)
+
+
+def _merge_existing(db, rows):
+    """Delete+insert fallback: carry blank optional fields and variants over from stored rows."""
+    cols = [ConverterDB.serial, *(getattr(ConverterDB, f) for f in FIELD_DEFAULTS), *(getattr(ConverterDB, v) for v in VARIANT_COLUMNS)]
+    existing = {r.serial: r._mapping for r in db.execute(select(*cols).where(ConverterDB.serial.in_([r["serial"] for r in rows])))}
+    merged = []
+    for row in rows:
+        old = existing.get(row["serial"])
+        if old is not None: row = {**row, **{f: old[f] for f in FIELD_DEFAULTS if not row[f]}}
+        keep = old is not None and row["image"] == old["image"]
+        merged.append({**row, **{v: old[v] if keep else None for v in VARIANT_COLUMNS}})
+    return merged
+
+
+def _write_batch(db, rows):
+    stmt = _upsert_stmt()
+    if stmt is not None:
+        db.execute(stmt, rows)
+    else:
+        # No native upsert: replace the batch's serials in one transaction
+        rows = _merge_existing(db, rows)
+        db.execute(delete(ConverterDB).where(ConverterDB.serial.in_([r["serial"] for r in rows])))
+        db.execute(insert(ConverterDB), rows)
+    version = bump_catalog_version(db)
+    db.commit()
+
+    # Keep this process's search index in sync (ids are assigned by the DB)
+    cols = [getattr(ConverterDB, c) for c in CATALOG_COLUMNS]
+    for row in db.execute(select(*cols).where(ConverterDB.serial.in_([r["serial"] for r in rows]))):
+        CATALOG.upsert(tuple(row), version)
+
+
+def import_stream(text_stream, fmt="csv", batch_size=IMPORT_BATCH_SIZE):
+    """Upsert every valid record from `text_stream`; returns a summary report.
+
+    Within a batch the last occurrence of a serial wins, so duplicate rows in
+    a file collapse to one upsert.
+    """
+    report = {"processed": 0, "upserted": 0, "duplicates": 0, "failed": 0, "errors": []}
+
+    def fail(line_no, serial, msg):
+        report["failed"] += 1
+        if len(report["errors"]) < MAX_REPORTED_ERRORS:
+            report["errors"].append({"line": line_no, "serial": serial, "error": msg})
+
+    db = SessionLocal()
+    try:
+        batch = {}   # serial -> (line_no, row)
+
+        def flush():
+            if not batch: return
+            items = list(batch.values())
+            batch.clear()
+            try:
+                _write_batch(db, [row for _, row in items])
+                report["upserted"] += len(items)
+            except Exception as e:
+                db.rollback()
+                # Isolate the offending rows instead of dropping the whole batch
+                for line_no, row in items:
+                    try:
+                        _write_batch(db, [row])
+                        report["upserted"] += 1
+                    except Exception as row_err:
+                        db.rollback()
+                        fail(line_no, row["serial"], str(getattr(row_err, "orig", row_err) or e))
+
+        for line_no, rec in _records(text_stream, fmt):
+            report["processed"] += 1
+            if isinstance(rec, str):
+                fail(line_no, None, rec)
+                continue
+            try:
+                row = _validate(rec)
+            except (ValidationError, ValueError, TypeError) as e:
+                msg = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors()) if isinstance(e, ValidationError) else str(e)
+                fail(line_no, rec.get("serial"), msg)
+                continue
+            if row["serial"] in batch: report["duplicates"] += 1
+            batch[row["serial"]] = (line_no, row)
+            if len(batch) >= batch_size: flush()
+        flush()
+    finally:
+        db.close()
+
+    print(f"📦 Catalog Import: {report['upserted']} upserted, {report['failed']} failed, {report['duplicates']} duplicates")
+    return report
+
+
+def export_stream(fmt="csv"):
+    """Yield the catalog as CSV or JSONL text chunks, in id order."""
+    if fmt not in ("csv", "jsonl"): raise ValueError(f"Unsupported format: {fmt}")
+    db = SessionLocal()
+    try:
+        if fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(FIELDS)
+            yield buf.getvalue()
+
+        stmt = select(*[getattr(ConverterDB, f) for f in FIELDS]).order_by(ConverterDB.id)
+        for chunk in db.execute(stmt.execution_options(yield_per=EXPORT_CHUNK)).partitions():
+            if fmt == "jsonl":
+                yield "".join(json.dumps(dict(zip(FIELDS, row))) + "\n" for row in chunk)
+            else:
+                buf = io.StringIO()
+                csv.writer(buf).writerows(chunk)
+                yield buf.getvalue()
+    finally:
+        db.close()
+
+
+def _cli(argv):
+    if len(argv) != 3 or argv[1] not in ("import", "export"):
+        print("usage: python catalog_io.py import|export <file.csv|file.jsonl>")
+        return 2
+    cmd, path = argv[1], argv[2]
+    fmt = detect_format(path)
+    if cmd == "import":
+        with open(path, newline="", encoding="utf-8-sig") as f:
+            report = import_stream(f, fmt)
+        print(json.dumps(report, indent=2))
+        return 1 if report["failed"] else 0
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        for chunk in export_stream(fmt): f.write(chunk)
+    print(f"✅ Exported catalog to {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_cli(sys.argv))
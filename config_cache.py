@@ -0,0 +1,85 @@
+import asyncio
+import os
+from dataclasses import dataclass
+
+from database import SessionLocal
+from models import AppConfig
+
+# ==========================================================
+# ⚙️ PROCESS-WIDE APP CONFIG CACHE (Versioned, write-through)
+# ==========================================================
+# Hot paths read an immutable snapshot instead of querying app_config.
+# update_config_api refreshes it on write; other workers notice through
+# the `version` column, polled every CONFIG_POLL_SECONDS.
+
+CONFIG_POLL_SECONDS = float(os.getenv("CONFIG_POLL_SECONDS", "5"))
+
+
+@dataclass(frozen=True, slots=True)
+class ConfigSnapshot:
+    default_margin: float
+    default_days_out: int
+    interest_pt: float
+    interest_pd: float
+    interest_rh: float
+    factor_calculator: float
+    factor_converter: float
+    factor_market: float
+    version: int
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(
+            default_margin=row.default_margin, default_days_out=row.default_days_out,
+            interest_pt=row.interest_pt, interest_pd=row.interest_pd, interest_rh=row.interest_rh,
+            factor_calculator=row.factor_calculator, factor_converter=row.factor_converter,
+            factor_market=row.factor_market, version=row.version or 0,
+        )
+
+
+class ConfigCache:
+    def __init__(self):
+        self._snapshot = None
+
+    def set_from_row(self, row):
+        # Single reference swap: readers see either the old or the new snapshot
+        self._snapshot = ConfigSnapshot.from_row(row)
+        return self._snapshot
+
+    def load(self):
+        db = SessionLocal()
+        try:
+            row = db.query(AppConfig).first()
+            if row is not None: self.set_from_row(row)
+        finally:
+            db.close()
+        return self._snapshot
+
+    def get(self):
+        snap = self._snapshot
+        return snap if snap is not None else self.load()
+
+    @property
+    def version(self):
+        snap = self._snapshot
+        return snap.version if snap is not None else None
+
+    def _poll(self):
+        db = SessionLocal()
+        try:
+            version = db.query(AppConfig.version).scalar()
+        finally:
+            db.close()
+        if version != self.version:
+            self.load()
+            print(f"⚙️ Config reloaded (v{self.version})")
+
+    async def watch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(CONFIG_POLL_SECONDS)
+            try: await loop.run_in_executor(None, self._poll)
+            except Exception as e: print(f"Config Poll Error: {e}")
+
+
+CONFIG = ConfigCache()
@@ -1,4 +1,6 @@
-from sqlalchemy import create_engine
+import uuid
+from sqlalchemy import create_engine, inspect, make_url, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker, declarative_base
 import os
 from dotenv import load_dotenv
@@ -16,16 +18,54 @@ if DATABASE_URL.startswith("postgres://"):
 
 print(f"🔌 Connecting to Database: {DATABASE_URL.split('://')[0]}...")
 
+# Connection budget per worker process, shared by the sync and async engines
+# (DB_ASYNC_SHARE goes to the async one): at most DB_POOL_SIZE +
+# DB_MAX_OVERFLOW Postgres connections per worker, so size it as
+# Neon's limit / uvicorn workers. Each engine needs at least one pooled
+# connection, so DB_POOL_SIZE must be >= 2 (DB_MAX_OVERFLOW: 0 or >= 2).
+# pool_recycle drops connections before idle timeouts close them under us.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "6"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "6"))
+DB_ASYNC_SHARE = float(os.getenv("DB_ASYNC_SHARE", "0.5"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+def _split(n):
+    """(sync, async) share of n connections; each engine keeps at least one."""
+    async_n = min(max(1, round(n * DB_ASYNC_SHARE)), max(1, n - 1))
+    return max(1, n - async_n), async_n
+
+def pool_args(share):
+    if DB_POOL_SIZE < 2 or DB_MAX_OVERFLOW == 1:
+        raise ValueError(f"DB_POOL_SIZE={DB_POOL_SIZE}, DB_MAX_OVERFLOW={DB_MAX_OVERFLOW}: the budget is split across "
+                         "the sync and async engines, so each must be at least 2 (overflow may also be 0)")
+    sizes, overflows = _split(DB_POOL_SIZE), _split(DB_MAX_OVERFLOW)
+    return dict(
+        pool_size=sizes[share], max_overflow=overflows[share] if DB_MAX_OVERFLOW else 0,
+        pool_recycle=DB_POOL_RECYCLE, pool_timeout=DB_POOL_TIMEOUT, pool_pre_ping=True,
+    )
+
+SYNC, ASYNC = 0, 1
+
 # Engine Config
 if "sqlite" in DATABASE_URL:
     engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
 else:
     # Postgres configuration: Enable Pre-Ping to handle disconnects
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True)
+    engine = create_engine(DATABASE_URL, **pool_args(SYNC))
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Lightweight migration: add columns introduced after a table was first created
+def ensure_columns(table, columns):
+    existing = {c["name"] for c in inspect(engine).get_columns(table)}
+    with engine.begin() as conn:
+        for name, ddl in columns.items():
+            if name not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {name} {ddl}"))
+                print(f"🛠️ Added column {table}.{name}")
+
 # Helper for Dependency Injection
 def get_db():
     db = SessionLocal()
@@ -34,3 +74,46 @@ def get_db():
     finally:
         db.close()
 
+# ==========================================================
+# ⚡ ASYNC ENGINE (asyncpg / aiosqlite)
+# ==========================================================
+# `async def` endpoints use this path so their queries don't block the
+# event loop; sync `def` endpoints keep get_db (FastAPI runs them in its
+# threadpool).
+def async_url(url):
+    url = make_url(url)
+    if url.drivername.startswith("sqlite"):
+        return url.set(drivername="sqlite+aiosqlite")
+    # asyncpg takes `ssl` instead of libpq's sslmode and knows no channel_binding
+    query = dict(url.query)
+    sslmode = query.pop("sslmode", None)
+    query.pop("channel_binding", None)
+    if sslmode and sslmode != "disable": query["ssl"] = sslmode
+    return url.set(drivername="postgresql+asyncpg", query=query)
+
+ASYNC_DATABASE_URL = async_url(DATABASE_URL)
+
+# Transaction-mode poolers (Neon's -pooler endpoints, PgBouncer) hand each
+# transaction to any server connection, so asyncpg's prepared statements
+# vanish between uses ("prepared statement ... does not exist")
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "1" if "-pooler" in (ASYNC_DATABASE_URL.host or "") else "0") == "1"
+
+def _asyncpg_connect_args():
+    if not DB_PGBOUNCER: return {}
+    return {
+        "statement_cache_size": 0,
+        "prepared_statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+    }
+
+if "sqlite" in DATABASE_URL:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL)
+else:
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, connect_args=_asyncpg_connect_args(), **pool_args(ASYNC))
+
+AsyncSessionLocal = async_sessionmaker(async_engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
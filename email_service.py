@@ -1,7 +1,19 @@
+import asyncio
+import json
 import os
 import random
+import uuid
+from datetime import datetime, timedelta
+from functools import lru_cache
+from string import Template
+
 import resend
 from dotenv import load_dotenv
+from sqlalchemy import and_, delete, insert, or_, select, update
+
+from database import SessionLocal
+from metrics import Counter
+from models import EmailOutbox
 
 # .env file load karo
 load_dotenv()
@@ -14,29 +26,54 @@ resend.api_key = os.getenv("RESEND_API_KEY")
 def generate_otp():
     return str(random.randint(100000, 999999))
 
-# ✅ Function 2: Email Bhejna (Latest Resend API Method)
-async def send_otp_email(email_to: str, otp: str):
-    
-    # 🌑 DARK THEME HTML TEMPLATE (Tera Wala Same Professional Look)
-    html_content = f"""
+# ==========================================================
+# 📧 EMAIL OUTBOX (Persisted queue + async delivery workers)
+# ==========================================================
+# send_otp_email only inserts an outbox row and wakes the dispatcher, so
+# the request never waits on Resend. The dispatcher claims due rows in
+# batches (one UPDATE with a claim token, so several workers never grab the
+# same row), delivers them with bounded concurrency and reschedules
+# failures with exponential backoff. Rows left "sending" by a crashed
+# worker are picked up again once their lease expires. Results are written
+# back only while the worker still holds its claim token, and rows carrying
+# an expiry (OTP codes) are dropped as "expired" instead of being sent late.
+# Sent and expired rows are deleted once older than EMAIL_RETENTION_DAYS.
+
+EMAIL_FROM = os.getenv("EMAIL_FROM", "SB PGM <noreply@sbpgm.com>")
+EMAIL_BATCH = int(os.getenv("EMAIL_BATCH", "20"))
+EMAIL_CONCURRENCY = int(os.getenv("EMAIL_CONCURRENCY", "4"))
+EMAIL_MAX_ATTEMPTS = int(os.getenv("EMAIL_MAX_ATTEMPTS", "6"))
+EMAIL_POLL_SECONDS = 5.0
+EMAIL_BACKOFF = 10.0
+EMAIL_BACKOFF_MAX = 1800.0
+EMAIL_LEASE = timedelta(minutes=2)
+OTP_TTL_MINUTES = 10   # verify/reset reject older codes
+EMAIL_RETENTION = timedelta(days=float(os.getenv("EMAIL_RETENTION_DAYS", "7")))
+PRUNE_EVERY_SECONDS = 3600
+
+EMAIL_TOTAL = Counter("email_delivery_total", "Outbox delivery attempts by result", ("provider", "result"))
+
+# --- 1. TEMPLATES (rendered from a cached Template, not a per-call f-string) ---
+# 🌑 DARK THEME HTML TEMPLATE (Tera Wala Same Professional Look)
+OTP_TEMPLATE = """
     <!DOCTYPE html>
     <html>
     <head>
         <style>
-            body {{ font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #121212; margin: 0; padding: 0; }}
-            .container {{ max-width: 600px; margin: 0 auto; background-color: #1E1E1E; padding: 40px; border-radius: 12px; margin-top: 30px; border: 1px solid #333333; }}
-            .header {{ text-align: center; border-bottom: 1px solid #333333; padding-bottom: 20px; margin-bottom: 30px; }}
-            .logo-text {{ color: #ffffff; font-size: 24px; font-weight: bold; margin: 0; text-transform: uppercase; letter-spacing: 2px; }}
-            .sub-text {{ color: #b0b0b0; font-size: 14px; margin-top: 5px; }}
+            body { font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif; background-color: #121212; margin: 0; padding: 0; }
+            .container { max-width: 600px; margin: 0 auto; background-color: #1E1E1E; padding: 40px; border-radius: 12px; margin-top: 30px; border: 1px solid #333333; }
+            .header { text-align: center; border-bottom: 1px solid #333333; padding-bottom: 20px; margin-bottom: 30px; }
+            .logo-text { color: #ffffff; font-size: 24px; font-weight: bold; margin: 0; text-transform: uppercase; letter-spacing: 2px; }
+            .sub-text { color: #b0b0b0; font-size: 14px; margin-top: 5px; }
             
-            .content {{ text-align: center; }}
-            .greeting {{ color: #ffffff; font-size: 18px; }}
-            .message {{ color: #b0b0b0; line-height: 1.6; font-size: 15px; }}
+            .content { text-align: center; }
+            .greeting { color: #ffffff; font-size: 18px; }
+            .message { color: #b0b0b0; line-height: 1.6; font-size: 15px; }
             
-            .otp-box {{ background-color: #252525; border: 1px dashed #00E676; border-radius: 8px; padding: 20px; margin: 25px 0; display: inline-block; min-width: 200px; }}
-            .otp-code {{ font-size: 36px; font-weight: bold; color: #00E676; letter-spacing: 8px; margin: 0; font-family: monospace; }}
+            .otp-box { background-color: #252525; border: 1px dashed #00E676; border-radius: 8px; padding: 20px; margin: 25px 0; display: inline-block; min-width: 200px; }
+            .otp-code { font-size: 36px; font-weight: bold; color: #00E676; letter-spacing: 8px; margin: 0; font-family: monospace; }
             
-            .footer {{ text-align: center; color: #555555; font-size: 12px; margin-top: 40px; border-top: 1px solid #333333; padding-top: 20px; }}
+            .footer { text-align: center; color: #555555; font-size: 12px; margin-top: 40px; border-top: 1px solid #333333; padding-top: 20px; }
         </style>
     </head>
     <body>
@@ -51,7 +88,7 @@ async def send_otp_email(email_to: str, otp: str):
                 <p class="message">You requested a login verification code.</p>
                 
                 <div class="otp-box">
-                    <p class="otp-code">{otp}</p>
+                    <p class="otp-code">$otp</p>
                 </div>
                 
                 <p class="message" style="font-size: 13px;">⚠️ Valid for 10 minutes only.<br>Do not share this code.</p>
@@ -64,22 +101,199 @@ async def send_otp_email(email_to: str, otp: str):
         </div>
     </body>
     </html>
-    """
+"""
+
+TEMPLATES = {
+    "otp": ("🔐 SB PGM Verification Code", OTP_TEMPLATE),
+}
+# Undelivered after this long -> pointless to send
+TEMPLATE_TTL = {
+    "otp": timedelta(minutes=OTP_TTL_MINUTES),
+}
+
+@lru_cache(maxsize=None)
+def _compiled(name):
+    return Template(TEMPLATES[name][1])
+
+def render(name, context):
+    return _compiled(name).substitute(context)
+
+
+# --- 2. PROVIDERS ---
+class ResendProvider:
+    name = "resend"
+
+    async def send(self, to_addr, subject, html):
+        params = {"from": EMAIL_FROM, "to": [to_addr], "subject": subject, "html": html}
+        # The SDK is blocking; keep it off the event loop
+        await asyncio.to_thread(resend.Emails.send, params)
+
+
+class ConsoleProvider:
+    """Prints instead of sending (local development)."""
+    name = "console"
+
+    async def send(self, to_addr, subject, html):
+        print(f"📧 [console] to={to_addr} subject={subject!r} ({len(html)} bytes)")
+
+
+class FakeProvider:
+    """Collects messages in memory; fails the first `fail_times` sends."""
+    name = "fake"
+
+    def __init__(self, fail_times=0):
+        self.sent = []
+        self.fail_times = fail_times
 
+    async def send(self, to_addr, subject, html):
+        if self.fail_times > 0:
+            self.fail_times -= 1
+            raise RuntimeError("fake provider failure")
+        self.sent.append((to_addr, subject, html))
+
+
+def default_provider():
+    choice = os.getenv("EMAIL_PROVIDER") or ("resend" if resend.api_key else "console")
+    return {"resend": ResendProvider, "console": ConsoleProvider, "fake": FakeProvider}[choice]()
+
+
+# --- 3. OUTBOX ---
+def _backoff(attempts):
+    delay = min(EMAIL_BACKOFF * (2 ** (attempts - 1)), EMAIL_BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+class Outbox:
+    def __init__(self, provider=None):
+        self.provider = provider
+        self._wake = None
+        self._loop = None
+        self._task = None
+        self._last_prune = None
+
+    def enqueue(self, to_addr, template, context):
+        now = datetime.utcnow()
+        ttl = TEMPLATE_TTL.get(template)
+        db = SessionLocal()
+        try:
+            db.execute(insert(EmailOutbox).values(
+                to_addr=to_addr, subject=TEMPLATES[template][0], template=template,
+                context=json.dumps(context), status="pending", attempts=0, next_attempt_at=now,
+                expires_at=now + ttl if ttl else None,
+            ))
+            db.commit()
+        finally:
+            db.close()
+        # Called from worker threads: wake the dispatcher via its own loop
+        if self._loop is not None: self._loop.call_soon_threadsafe(self._wake.set)
+
+    def _claim(self):
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        due = or_(
+            and_(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now),
+            and_(EmailOutbox.status == "sending", EmailOutbox.locked_until < now),
+        )
+        expired = and_(EmailOutbox.status.in_(("pending", "sending")), EmailOutbox.expires_at < now)
+        db = SessionLocal()
+        try:
+            # Stale OTPs are dropped, not delivered (a claimed one is only dropped once its lease is up)
+            res = db.execute(update(EmailOutbox).where(expired, or_(EmailOutbox.status == "pending", EmailOutbox.locked_until < now))
+                             .values(status="expired", context=None, claim_token=None, locked_until=None))
+            if res.rowcount:
+                EMAIL_TOTAL.inc(self.provider.name, "expired", amount=res.rowcount)
+                db.commit()
+            ids = db.execute(select(EmailOutbox.id).where(due).order_by(EmailOutbox.id).limit(EMAIL_BATCH)).scalars().all()
+            if not ids: return []
+            # Re-check `due` in the UPDATE: another worker may have claimed some ids meanwhile
+            db.execute(update(EmailOutbox).where(EmailOutbox.id.in_(ids), due)
+                       .values(status="sending", claim_token=token, locked_until=now + EMAIL_LEASE))
+            db.commit()
+            return db.execute(select(EmailOutbox.id, EmailOutbox.claim_token, EmailOutbox.to_addr, EmailOutbox.subject,
+                                     EmailOutbox.template, EmailOutbox.context, EmailOutbox.attempts)
+                              .where(EmailOutbox.claim_token == token)).all()
+        finally:
+            db.close()
+
+    def _finish(self, results):
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            for row_id, token, attempts, error in results:
+                if error is None:
+                    values = {"status": "sent", "sent_at": now, "context": None, "last_error": None}
+                elif attempts >= EMAIL_MAX_ATTEMPTS:
+                    values = {"status": "failed", "context": None, "last_error": error}
+                else:
+                    values = {"status": "pending", "next_attempt_at": now + _backoff(attempts), "last_error": error}
+                # Lease lost (another worker re-claimed the row): its result wins
+                db.execute(update(EmailOutbox).where(EmailOutbox.id == row_id, EmailOutbox.claim_token == token)
+                           .values(attempts=attempts, claim_token=None, locked_until=None, **values))
+            db.commit()
+        finally:
+            db.close()
+
+    def _prune(self):
+        db = SessionLocal()
+        try:
+            res = db.execute(delete(EmailOutbox).where(EmailOutbox.status.in_(("sent", "expired")),
+                                                       EmailOutbox.created_at < datetime.utcnow() - EMAIL_RETENTION))
+            db.commit()
+            return res.rowcount
+        finally:
+            db.close()
+
+    async def _deliver(self, row, slots):
+        async with slots:
+            attempts = row.attempts + 1
+            try:
+                await self.provider.send(row.to_addr, row.subject, render(row.template, json.loads(row.context or "{}")))
+                EMAIL_TOTAL.inc(self.provider.name, "sent")
+                print(f"✅ Email sent via {self.provider.name} to {row.to_addr}")
+                return row.id, row.claim_token, attempts, None
+            except Exception as e:
+                EMAIL_TOTAL.inc(self.provider.name, "failed" if attempts >= EMAIL_MAX_ATTEMPTS else "retry")
+                print(f"❌ Error sending email to {row.to_addr} (attempt {attempts}): {e}")
+                return row.id, row.claim_token, attempts, str(e)[:500]
+
+    async def run(self):
+        slots = asyncio.Semaphore(EMAIL_CONCURRENCY)
+        while True:
+            if self._last_prune is None or self._loop.time() - self._last_prune > PRUNE_EVERY_SECONDS:
+                self._last_prune = self._loop.time()
+                try:
+                    pruned = await asyncio.to_thread(self._prune)
+                    if pruned: print(f"🧹 Pruned {pruned} old outbox rows")
+                except Exception as e:
+                    print(f"Email Outbox Prune Error: {e}")
+            try:
+                rows = await asyncio.to_thread(self._claim)
+                if rows:
+                    results = await asyncio.gather(*(self._deliver(r, slots) for r in rows))
+                    await asyncio.to_thread(self._finish, results)
+                    if len(rows) == EMAIL_BATCH: continue   # more may be due right away
+            except Exception as e:
+                print(f"Email Outbox Error: {e}")
+            try: await asyncio.wait_for(self._wake.wait(), EMAIL_POLL_SECONDS)
+            except asyncio.TimeoutError: pass
+            self._wake.clear()
+
+    def start(self):
+        if self.provider is None: self.provider = default_provider()
+        self._wake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._task = asyncio.create_task(self.run(), name="email-outbox")
+        print(f"✅ Email Outbox Ready ({self.provider.name})")
+        return self._task
+
+
+OUTBOX = Outbox()
+
+# ✅ Function 2: Email Bhejna (queued; delivered by the outbox workers)
+async def send_otp_email(email_to: str, otp: str):
     try:
-        # Resend API call (Bahut Fast hai)
-        params = {
-            "from": "SB PGM <noreply@sbpgm.com>",  # Agar domain verify nahi hai toh ye use kar
-            # "from": "Support <support@sbpgm.com>",   # Jab domain verify ho jaye tab ye khol dena
-            "to": [email_to],
-            "subject": "🔐 SB PGM Verification Code",
-            "html": html_content,
-        }
-
-        email = resend.Emails.send(params)
-        print(f"✅ OTP Sent via Resend to {email_to}")
+        await asyncio.to_thread(OUTBOX.enqueue, email_to, "otp", {"otp": otp})
         return True
-
     except Exception as e:
-        print(f"❌ Error sending email via Resend: {e}")
+        print(f"❌ Error queueing email: {e}")
         return False
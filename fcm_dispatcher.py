@@ -0,0 +1,211 @@
+import asyncio
+import os
+import random
+
+from metrics import Counter, Gauge
+
+# ==========================================================
+# 🔔 FCM DISPATCHER (Coalesced topic subscriptions + batched sends)
+# ==========================================================
+# /update-token no longer makes one Firebase call per request: tokens are
+# parked for SUBSCRIBE_LINGER seconds and subscribed in calls of up to 1000
+# (the API limit), and each caller awaits its own token's result. Alerts
+# are queued and sent with send_each in batches of up to 500, off the event
+# loop; transient failures (unavailable / internal / quota) are retried
+# with exponential backoff. The transport is swappable (FakeTransport for
+# local runs).
+
+SUBSCRIBE_BATCH = 1000
+SEND_BATCH = 500
+SUBSCRIBE_LINGER = float(os.getenv("FCM_SUBSCRIBE_LINGER", "0.25"))
+# Longest a request waits for its token; the subscription carries on after that
+SUBSCRIBE_WAIT = float(os.getenv("FCM_SUBSCRIBE_WAIT", "5"))
+FCM_RETRIES = int(os.getenv("FCM_RETRIES", "4"))
+FCM_BACKOFF = 2.0
+FCM_BACKOFF_MAX = 60.0
+RETRYABLE_CODES = {"UNAVAILABLE", "INTERNAL", "RESOURCE_EXHAUSTED", "DEADLINE_EXCEEDED", "UNKNOWN"}
+
+FCM_SUBSCRIPTIONS = Counter("fcm_subscriptions_total", "Token subscriptions by result", ("result",))
+FCM_MESSAGES = Counter("fcm_messages_total", "FCM messages by result", ("result",))
+FCM_CALLS = Counter("fcm_api_calls_total", "Firebase API calls by kind", ("kind",))
+
+
+class TransportUnavailable(Exception):
+    """The transport can't work at all (e.g. Firebase not configured); never retried."""
+
+
+def _retryable(exc):
+    return getattr(exc, "code", None) in RETRYABLE_CODES
+
+
+def _backoff(attempt):
+    return min(FCM_BACKOFF * (2 ** attempt), FCM_BACKOFF_MAX) * random.uniform(0.8, 1.2)
+
+
+# --- 1. TRANSPORTS (blocking; the dispatcher runs them in threads) ---
+class FirebaseTransport:
+    name = "firebase"
+
+    @staticmethod
+    def _ready():
+        import firebase_admin
+        if not firebase_admin._apps: raise TransportUnavailable("Firebase not initialized")
+
+    def subscribe(self, tokens, topic):
+        """Returns {index: reason} for tokens that failed."""
+        self._ready()
+        from firebase_admin import messaging
+        resp = messaging.subscribe_to_topic(tokens, topic)
+        return {e.index: e.reason for e in resp.errors}
+
+    def send_each(self, messages):
+        """Returns one entry per message: None on success, else the exception."""
+        self._ready()
+        from firebase_admin import messaging
+        built = [
+            messaging.Message(
+                notification=messaging.Notification(title=m["title"], body=m["body"]),
+                data=m.get("data"), topic=m.get("topic"), token=m.get("token"),
+            )
+            for m in messages
+        ]
+        return [None if r.success else r.exception for r in messaging.send_each(built).responses]
+
+
+class FakeFCMError(Exception):
+    def __init__(self, code, msg="fake fcm error"):
+        super().__init__(msg)
+        self.code = code
+
+
+class FakeTransport:
+    """Records calls; `fail` maps a token/topic to an error code to return for it once."""
+    name = "fake"
+
+    def __init__(self, fail=None):
+        self.subscribed = {}   # topic -> set(tokens)
+        self.sent = []
+        self.calls = []
+        self.fail = dict(fail or {})
+
+    def subscribe(self, tokens, topic):
+        self.calls.append(("subscribe", len(tokens)))
+        errors = {}
+        for i, t in enumerate(tokens):
+            if t in self.fail: errors[i] = self.fail.pop(t)
+            else: self.subscribed.setdefault(topic, set()).add(t)
+        return errors
+
+    def send_each(self, messages):
+        self.calls.append(("send_each", len(messages)))
+        out = []
+        for m in messages:
+            code = self.fail.pop(m.get("topic") or m.get("token"), None)
+            if code: out.append(FakeFCMError(code))
+            else:
+                self.sent.append(m)
+                out.append(None)
+        return out
+
+
+# --- 2. DISPATCHER ---
+class FCMDispatcher:
+    def __init__(self, transport=None):
+        self.transport = transport or FirebaseTransport()
+        self._pending = {}   # topic -> {token: [futures]}
+        self._sub_wake = None
+        self._send_queue = None
+        self._tasks = []
+
+    def start(self):
+        self._sub_wake = asyncio.Event()
+        self._send_queue = asyncio.Queue()
+        self._tasks = [
+            asyncio.create_task(self._run_subscriptions(), name="fcm-subscribe"),
+            asyncio.create_task(self._run_sender(), name="fcm-send"),
+        ]
+        print(f"✅ FCM Dispatcher Ready ({self.transport.name})")
+
+    def queued(self):
+        return sum(len(t) for t in self._pending.values()) + (self._send_queue.qsize() if self._send_queue else 0)
+
+    # --- Subscriptions ---
+    async def subscribe(self, token, topic="all_users", timeout=SUBSCRIBE_WAIT):
+        """Wait until this token is subscribed; True on success, False on failure or timeout."""
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.setdefault(topic, {}).setdefault(token, []).append(fut)
+        self._sub_wake.set()
+        try:
+            # Shielded: a slow batch (retry backoff) keeps going for the other callers
+            ok = await asyncio.wait_for(asyncio.shield(fut), timeout)
+        except asyncio.TimeoutError:
+            # Counted here only: the late result isn't recorded again
+            FCM_SUBSCRIPTIONS.inc("timeout")
+            return False
+        FCM_SUBSCRIPTIONS.inc("ok" if ok else "failed")
+        return ok
+
+    async def _run_subscriptions(self):
+        while True:
+            await self._sub_wake.wait()
+            await asyncio.sleep(SUBSCRIBE_LINGER)   # let the launch wave pile up
+            self._sub_wake.clear()
+            pending, self._pending = self._pending, {}
+            for topic, by_token in pending.items():
+                tokens = list(by_token)
+                for i in range(0, len(tokens), SUBSCRIBE_BATCH):
+                    chunk = tokens[i:i + SUBSCRIBE_BATCH]
+                    results = await self._subscribe_chunk(chunk, topic)
+                    for token, ok in zip(chunk, results):
+                        for fut in by_token[token]:
+                            if not fut.done(): fut.set_result(ok)
+
+    async def _subscribe_chunk(self, tokens, topic):
+        for attempt in range(FCM_RETRIES + 1):
+            try:
+                FCM_CALLS.inc("subscribe")
+                errors = await asyncio.to_thread(self.transport.subscribe, tokens, topic)
+                for idx, reason in errors.items(): print(f"Token Sub Error: {reason}")
+                return [i not in errors for i in range(len(tokens))]
+            except TransportUnavailable as e:
+                print(f"Token Sub Error: {e}")
+                break
+            except Exception as e:
+                print(f"⚠️ FCM subscribe attempt {attempt + 1} failed ({len(tokens)} tokens): {e}")
+                if attempt < FCM_RETRIES: await asyncio.sleep(_backoff(attempt))
+        return [False] * len(tokens)
+
+    # --- Sends ---
+    def send(self, title, body, topic="all_users", token=None, data=None):
+        """Queue a notification; delivery happens in the background."""
+        msg = {"title": title, "body": body, "topic": None if token else topic, "token": token, "data": data}
+        self._send_queue.put_nowait((msg, 0))
+
+    async def _run_sender(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._send_queue.get()]
+            while len(batch) < SEND_BATCH and not self._send_queue.empty():
+                batch.append(self._send_queue.get_nowait())
+            call_failed = False
+            try:
+                FCM_CALLS.inc("send_each")
+                results = await asyncio.to_thread(self.transport.send_each, [m for m, _ in batch])
+            except TransportUnavailable as e:
+                results = [e] * len(batch)
+            except Exception as e:
+                # Whole call failed (network / auth): treat every message as transient
+                results, call_failed = [e] * len(batch), True
+            for (msg, attempt), err in zip(batch, results):
+                if err is None:
+                    FCM_MESSAGES.inc("sent")
+                elif (call_failed or _retryable(err)) and attempt < FCM_RETRIES:
+                    FCM_MESSAGES.inc("retry")
+                    loop.call_later(_backoff(attempt), self._send_queue.put_nowait, (msg, attempt + 1))
+                else:
+                    FCM_MESSAGES.inc("failed")
+                    print(f"Failed to send FCM ({msg.get('topic') or 'token'}): {err}")
+
+
+FCM = FCMDispatcher()
+Gauge("fcm_queued", "Token subscriptions and messages waiting to be sent", fn=lambda: {(): FCM.queued()})
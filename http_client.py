@@ -0,0 +1,47 @@
+import os
+import aiohttp
+
+# ==========================================================
+# 🌐 SHARED HTTP CLIENT (One pooled aiohttp session per process)
+# ==========================================================
+# Scrapers reuse keep-alive connections instead of paying a new TCP + TLS
+# handshake per fetch. Created on startup, closed on shutdown.
+
+POOL_LIMIT = int(os.getenv("HTTP_POOL_LIMIT", "50"))
+POOL_LIMIT_PER_HOST = int(os.getenv("HTTP_POOL_LIMIT_PER_HOST", "8"))
+DNS_CACHE_TTL = 300
+KEEPALIVE_TIMEOUT = 60
+DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=15)
+
+_session = None
+
+
+def _new_session():
+    connector = aiohttp.TCPConnector(
+        limit=POOL_LIMIT,
+        limit_per_host=POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=DNS_CACHE_TTL,
+        keepalive_timeout=KEEPALIVE_TIMEOUT,
+        enable_cleanup_closed=True,
+    )
+    return aiohttp.ClientSession(connector=connector, timeout=DEFAULT_TIMEOUT)
+
+
+def get_session():
+    # Lazy fallback so callers work even if startup() hasn't run (scripts)
+    global _session
+    if _session is None or _session.closed:
+        _session = _new_session()
+    return _session
+
+
+async def startup():
+    get_session()
+    print("✅ HTTP Client Pool Ready")
+
+
+async def shutdown():
+    global _session
+    if _session is not None and not _session.closed:
+        await _session.close()
+    _session = None
@@ -0,0 +1,215 @@
+import asyncio
+import os
+import shutil
+import time
+import uuid
+
+from sqlalchemy import select, update
+
+from catalog_index import CATALOG, CATALOG_COLUMNS, bump_catalog_version
+from database import SessionLocal
+import image_variants
+from metrics import Counter, Gauge
+from models import ConverterDB
+
+# ==========================================================
+# 🖼️ CONVERTER IMAGE UPLOAD QUEUE (Local save first, push in background)
+# ==========================================================
+# add_conv writes the upload to UPLOAD_DIR and returns immediately with a
+# local /static URL. A few background workers then push the file to the
+# storage backend and swap ConverterDB.image to the final URL, but only if
+# the row still points at the local copy (a newer upload or a delete wins).
+# Thumb/medium WebP variants are rendered first (see image_variants).
+#
+# URLs are absolute: PUBLIC_BASE_URL if set (use it behind a proxy that
+# rewrites the host), else the base URL of the upload request.
+#
+# The queue itself lives in memory, but the pending state is in the table:
+# a row whose image is still a local /static URL hasn't been pushed. With
+# a remote backend, the market leader (shared_state.py) calls recover() to
+# re-queue those rows, so uploads cut short by a restart are retried once,
+# not once per worker. Files younger than RECOVER_MIN_AGE are skipped: they
+# may still be in another worker's queue. The local original is deleted
+# once a remote copy is stored.
+
+UPLOAD_DIR = "static/images"
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+LOCAL_PREFIX = "/" + UPLOAD_DIR + "/"
+UPLOAD_WORKERS = int(os.getenv("IMAGE_UPLOAD_WORKERS", "3"))
+UPLOAD_RETRIES = 3
+UPLOAD_BACKOFF = 5.0
+RECOVER_MIN_AGE = float(os.getenv("IMAGE_RECOVER_MIN_AGE_SECONDS", "600"))
+
+UPLOAD_TOTAL = Counter("image_upload_total", "Background image uploads by result", ("backend", "result"))
+
+
+def local_url(path, base_url=""):
+    return f"{PUBLIC_BASE_URL or base_url.rstrip('/')}/{os.path.relpath(path).replace(os.sep, '/')}"
+
+
+def _base_of(url):
+    """Base URL a local image URL was built with."""
+    return url[:url.find(LOCAL_PREFIX)] if LOCAL_PREFIX in url else ""
+
+
+def save_local(fileobj, filename):
+    """Copy an upload into UPLOAD_DIR under a unique name; returns the path."""
+    ext = os.path.splitext(filename or "")[1].lower() or ".jpg"
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}{ext}")
+    with open(path, "wb") as out:
+        shutil.copyfileobj(fileobj, out)
+    return path
+
+
+# --- 1. STORAGE BACKENDS ---
+class LocalStorage:
+    """Keeps images on this server's disk, served via /static."""
+    name = "local"
+    remote = False
+
+    def __init__(self, root=UPLOAD_DIR):
+        self.root = root
+
+    async def store(self, path, key, base_url=""):
+        dest = os.path.join(self.root, os.path.basename(path))
+        if os.path.abspath(dest) != os.path.abspath(path):
+            os.makedirs(self.root, exist_ok=True)
+            await asyncio.to_thread(shutil.copyfile, path, dest)
+        return local_url(dest, base_url)
+
+
+class CloudinaryStorage:
+    name = "cloudinary"
+    remote = True
+
+    def __init__(self, folder="converters"):
+        self.folder = folder
+
+    async def store(self, path, key, base_url=""):
+        import cloudinary.uploader
+        # The SDK is blocking; run it off the event loop
+        res = await asyncio.to_thread(cloudinary.uploader.upload, path, folder=self.folder, public_id=key, overwrite=True)
+        return res.get("secure_url")
+
+
+def default_backend():
+    choice = os.getenv("IMAGE_STORAGE") or ("cloudinary" if os.getenv("CLOUDINARY_CLOUD_NAME") else "local")
+    return CloudinaryStorage() if choice == "cloudinary" else LocalStorage()
+
+
+# --- 2. QUEUE + WORKERS ---
+class UploadQueue:
+    def __init__(self, backend=None, workers=UPLOAD_WORKERS):
+        self.backend = backend
+        self.workers = workers
+        self._queue = None
+        self._loop = None
+        self._tasks = []
+
+    def start(self):
+        if self.backend is None: self.backend = default_backend()
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"image-upload:{i}") for i in range(self.workers)]
+        print(f"✅ Image Upload Queue Ready ({self.backend.name}, {self.workers} workers)")
+
+    def recover(self):
+        """Re-queue uploads left pending by a restart. Run in one process only."""
+        if self.backend is not None and self.backend.remote:
+            self._tasks.append(asyncio.create_task(self._recover(), name="image-upload:recover"))
+
+    async def _recover(self):
+        try: pending = await asyncio.to_thread(_pending_rows)
+        except Exception as e:
+            print(f"Image Upload Recover Error: {e}")
+            return
+        cutoff = time.time() - RECOVER_MIN_AGE
+        queued = 0
+        for serial, url in pending:
+            path = os.path.join(UPLOAD_DIR, url.rsplit("/", 1)[-1])
+            try: stale = os.path.getmtime(path) < cutoff
+            except OSError: continue
+            if stale:
+                self._queue.put_nowait((serial, path, url))
+                queued += 1
+        if queued: print(f"🔁 Re-queued {queued} pending image uploads")
+
+    def submit(self, serial, path, placeholder_url):
+        """Queue a local file for upload. Safe to call from threadpool endpoints."""
+        if self._loop is None:
+            print("⚠️ Image upload queue not started; keeping local image")
+            return False
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (serial, path, placeholder_url))
+        return True
+
+    def __len__(self):
+        return self._queue.qsize() if self._queue is not None else 0
+
+    async def _worker(self):
+        while True:
+            serial, path, placeholder_url = await self._queue.get()
+            try:
+                await self._process(serial, path, placeholder_url)
+            except Exception as e:
+                print(f"Image Upload Error ({serial}): {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, serial, path, placeholder_url):
+        # Already pushed (and the original removed) by another worker
+        if not os.path.exists(path): return
+        # Variants are rendered from the local original and always served locally
+        base_url = _base_of(placeholder_url)
+        variants = await image_variants.generate(path, os.path.dirname(path))
+        if variants:
+            await asyncio.to_thread(_set_columns, serial, placeholder_url, {f"image_{name}": local_url(p, base_url) for name, p in variants.items()})
+
+        key = os.path.splitext(os.path.basename(path))[0]
+        for attempt in range(UPLOAD_RETRIES):
+            try:
+                url = await self.backend.store(path, key, base_url)
+                break
+            except Exception as e:
+                print(f"⚠️ Image upload attempt {attempt + 1} failed for {serial}: {e}")
+                if attempt + 1 < UPLOAD_RETRIES: await asyncio.sleep(UPLOAD_BACKOFF * (2 ** attempt))
+        else:
+            UPLOAD_TOTAL.inc(self.backend.name, "failed")
+            return   # the row keeps serving the local copy
+
+        if url and url != placeholder_url:
+            await asyncio.to_thread(_set_columns, serial, placeholder_url, {"image": url})
+        # The row now points at the remote copy (or at a newer upload); variants stay local
+        if url and self.backend.remote:
+            try: os.remove(path)
+            except OSError: pass
+        UPLOAD_TOTAL.inc(self.backend.name, "ok")
+
+
+def _set_columns(serial, placeholder_url, values):
+    db = SessionLocal()
+    try:
+        res = db.execute(
+            update(ConverterDB)
+            .where(ConverterDB.serial == serial, ConverterDB.image == placeholder_url)
+            .values(**values)
+        )
+        version = bump_catalog_version(db) if res.rowcount else None
+        db.commit()
+        if res.rowcount:
+            row = db.execute(select(*[getattr(ConverterDB, c) for c in CATALOG_COLUMNS]).where(ConverterDB.serial == serial)).first()
+            if row is not None: CATALOG.upsert(tuple(row), version)
+    finally:
+        db.close()
+
+
+def _pending_rows():
+    db = SessionLocal()
+    try:
+        return db.execute(select(ConverterDB.serial, ConverterDB.image).where(ConverterDB.image.contains(LOCAL_PREFIX))).all()
+    finally:
+        db.close()
+
+
+UPLOADS = UploadQueue()
+Gauge("image_upload_queue_depth", "Images waiting for a background upload", fn=lambda: {(): len(UPLOADS)})
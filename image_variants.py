@@ -0,0 +1,86 @@
+import asyncio
+import hashlib
+import io
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from fastapi.staticfiles import StaticFiles
+
+# ==========================================================
+# 🖼️ IMAGE VARIANTS (WebP thumb / medium, content-hashed names)
+# ==========================================================
+# Resizing is CPU-bound, so it runs in a small process pool off the request
+# path. Each variant is written next to its original as
+# <stem>.<variant>.<hash>.webp; the hash changes with the bytes, so the files
+# can be served as immutable with a one-year cache lifetime.
+
+VARIANTS = {"thumb": 160, "medium": 640}
+WEBP_QUALITY = 80
+VARIANT_WORKERS = int(os.getenv("IMAGE_VARIANT_WORKERS", "2"))
+
+HASHED_NAME = re.compile(r"\.[0-9a-f]{16}\.webp$")
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+DEFAULT_CACHE = "public, max-age=3600"
+
+_pool = None
+
+
+def render_variants(path, out_dir):
+    """Write every variant of `path` into `out_dir`; returns {variant: path}.
+
+    Runs inside a worker process.
+    """
+    from PIL import Image, ImageOps
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    out = {}
+    with Image.open(path) as src:
+        img = ImageOps.exif_transpose(src)
+        img = img.convert("RGBA" if "A" in img.getbands() else "RGB")
+        for name, size in VARIANTS.items():
+            variant = img.copy()
+            variant.thumbnail((size, size), Image.LANCZOS)
+            buf = io.BytesIO()
+            variant.save(buf, "WEBP", quality=WEBP_QUALITY, method=4)
+            data = buf.getvalue()
+            digest = hashlib.blake2b(data, digest_size=8).hexdigest()
+            dest = os.path.join(out_dir, f"{stem}.{name}.{digest}.webp")
+            if not os.path.exists(dest):
+                tmp = dest + ".tmp"
+                with open(tmp, "wb") as f: f.write(data)
+                os.replace(tmp, dest)
+            out[name] = dest
+    return out
+
+
+def _get_pool():
+    global _pool
+    if _pool is None: _pool = ProcessPoolExecutor(max_workers=VARIANT_WORKERS)
+    return _pool
+
+
+async def generate(path, out_dir):
+    """Render variants in the process pool; {} if Pillow is missing or decoding fails."""
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_get_pool(), render_variants, path, out_dir)
+    except ImportError:
+        print("⚠️ Pillow not installed; skipping image variants")
+    except Exception as e:
+        print(f"Image Variant Error ({os.path.basename(path)}): {e}")
+    return {}
+
+
+def shutdown():
+    global _pool
+    if _pool is not None: _pool.shutdown(wait=False, cancel_futures=True)
+    _pool = None
+
+
+class CachedStaticFiles(StaticFiles):
+    """StaticFiles with Cache-Control: content-hashed files never change."""
+
+    def file_response(self, full_path, stat_result, scope, status_code=200):
+        response = super().file_response(full_path, stat_result, scope, status_code)
+        response.headers["Cache-Control"] = IMMUTABLE_CACHE if HASHED_NAME.search(str(full_path)) else DEFAULT_CACHE
+        return response
@@ -0,0 +1,104 @@
+import asyncio
+import os
+
+import orjson
+
+# ==========================================================
+# 📡 LIVE RATES PUSH HUB (WebSocket + SSE fan-out)
+# ==========================================================
+# live_rates.publish() hands each tick's diff to HUB.broadcast(), which
+# serializes it once and queues the same bytes for every subscriber.
+# A subscriber whose queue fills up (slow consumer) has its backlog dropped
+# and gets one full snapshot instead, so it never blocks the market loop.
+
+SUBSCRIBER_QUEUE_SIZE = int(os.getenv("LIVE_PUSH_QUEUE_SIZE", "32"))
+HEARTBEAT_SECONDS = 15
+
+_RESYNC = object()
+
+
+def diff_payload(prev, new):
+    """Changed tickers/PGM entries and raw/ai_insight fields between two payloads."""
+    changes = {}
+    for cat in ("metals", "energy", "forex"):
+        old = {m["name"]: m for m in (prev or {}).get(cat, [])}
+        changed = [m for m in new.get(cat, []) if old.get(m["name"]) != m]
+        if changed: changes[cat] = changed
+        names = {m["name"] for m in new.get(cat, [])}
+        removed = [name for name in old if name not in names]
+        if removed: changes.setdefault("removed", []).extend(removed)
+    for key in ("raw", "ai_insight"):
+        if (prev or {}).get(key) != new.get(key): changes[key] = new.get(key)
+    return changes
+
+
+class Subscriber:
+    __slots__ = ("queue", "dropped")
+
+    def __init__(self, maxsize):
+        self.queue = asyncio.Queue(maxsize)
+        self.dropped = 0
+
+
+class LiveHub:
+    def __init__(self, queue_size=SUBSCRIBER_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subs = set()
+        self._snapshot_msg = (None, b"")   # (seq, bytes) cache for resyncs
+        self._snapshot_source = None       # callable returning the current LiveRatesSnapshot
+
+    def set_snapshot_source(self, fn):
+        self._snapshot_source = fn
+
+    def __len__(self):
+        return len(self._subs)
+
+    def subscribe(self):
+        sub = Subscriber(self.queue_size)
+        self._subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        self._subs.discard(sub)
+
+    def snapshot_message(self):
+        snap = self._snapshot_source()
+        if self._snapshot_msg[0] != snap.seq:
+            self._snapshot_msg = (snap.seq, orjson.dumps({"type": "snapshot", "seq": snap.seq, "data": snap.payload}))
+        return self._snapshot_msg
+
+    def broadcast(self, seq, changes):
+        # Nobody listening -> skip serialization entirely
+        if not self._subs or not changes: return
+        msg = (seq, orjson.dumps({"type": "diff", "seq": seq, "changes": changes}))
+        for sub in self._subs:
+            try:
+                sub.queue.put_nowait(msg)
+            except asyncio.QueueFull:
+                # Slow consumer: drop its backlog, resync with one snapshot
+                while not sub.queue.empty(): sub.queue.get_nowait()
+                sub.queue.put_nowait(_RESYNC)
+                sub.dropped += 1
+
+    async def stream(self, sub, heartbeat=None):
+        """Yield message bytes for `sub`: a snapshot first, then diffs.
+
+        With `heartbeat` set, yields None after that many idle seconds.
+        """
+        last_seq, msg = self.snapshot_message()
+        yield msg
+        while True:
+            try:
+                item = await asyncio.wait_for(sub.queue.get(), heartbeat) if heartbeat else await sub.queue.get()
+            except asyncio.TimeoutError:
+                yield None
+                continue
+            if item is _RESYNC: item = self.snapshot_message()
+            seq, msg = item
+            # Diffs already covered by the last snapshot sent are skipped
+            if seq <= last_seq: continue
+            last_seq = seq
+            yield msg
+
+
+HUB = LiveHub()
@@ -0,0 +1,86 @@
+import hashlib
+import time
+from dataclasses import dataclass
+
+import orjson
+
+from config_cache import CONFIG
+from live_push import HUB, diff_payload
+from metrics import Gauge
+
+# ==========================================================
+# 📈 PRE-SERIALIZED /live_rates PAYLOAD (Published once per market tick)
+# ==========================================================
+# The market loop publishes the response bytes + ETag after each update, so
+# /live_rates is a reference read and polling clients with a matching
+# If-None-Match get a 304 without any work.
+
+PGM_NAMES = ("Platinum", "Palladium", "Rhodium")
+
+
+@dataclass(frozen=True, slots=True)
+class LiveRatesSnapshot:
+    seq: int
+    etag: str
+    body: bytes
+    payload: dict
+    source: dict          # the CACHE["data"] dict this was built from
+    config_version: int
+    published_at: float
+
+
+_current = None
+_seq = 0
+
+
+def build_payload(data, factor):
+    response_data = {
+        "metals": [], "energy": data.get("energy", []),
+        "forex": data.get("forex", []), "raw": data.get("raw", {}),
+        "ai_insight": data.get("ai_insight", {})
+    }
+    for m in data.get("metals", []):
+        new_m = m.copy()
+        if m['name'] in PGM_NAMES:
+            new_m['price'] = m['price'] * factor
+        response_data['metals'].append(new_m)
+    return response_data
+
+
+def publish(data):
+    """Build and swap in the payload for a fresh CACHE["data"] dict."""
+    global _current, _seq
+    conf = CONFIG.get()
+    factor = conf.factor_market if conf is not None else 1.0
+    payload = build_payload(data, factor)
+    body = orjson.dumps(payload)
+    _seq += 1
+    etag = '"' + hashlib.blake2b(body, digest_size=8).hexdigest() + '"'
+    prev = _current
+    _current = LiveRatesSnapshot(_seq, etag, body, payload, data, CONFIG.version, time.time())
+    if len(HUB): HUB.broadcast(_seq, diff_payload(prev.payload if prev else None, payload))
+    return _current
+
+
+def latest():
+    return _current if _current is not None else publish({})
+
+
+def current(data):
+    """Latest snapshot, rebuilt only if the market data or config moved on."""
+    snap = _current
+    if snap is None or snap.source is not data or snap.config_version != CONFIG.version:
+        snap = publish(data)
+    return snap
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match: return False
+    if if_none_match.strip() == "*": return True
+    return any(tag.strip().removeprefix("W/") == etag for tag in if_none_match.split(","))
+
+
+HUB.set_snapshot_source(latest)
+
+Gauge("live_rates_age_seconds", "Seconds since /live_rates was last published", fn=lambda: {(): round(time.time() - _current.published_at, 3)} if _current else {})
+Gauge("live_push_subscribers", "Connected WebSocket/SSE subscribers", fn=lambda: {(): len(HUB)})
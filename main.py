@@ -1,18 +1,21 @@
-from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form
+from fastapi import FastAPI, Depends, HTTPException, File, UploadFile, Form, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 from pydantic import BaseModel, EmailStr
+from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
-from fastapi.staticfiles import StaticFiles
 from sqlalchemy import create_engine
 from sqlalchemy.orm import Session, sessionmaker
-from sqlalchemy import or_
+from sqlalchemy import func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
 import asyncio
+import io
+import json
 import os
 import shutil
 import cloudinary
-import cloudinary.uploader
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timezone
 import secrets
 
 # Cloudinary Config (From Env)
@@ -25,77 +28,63 @@ cloudinary.config(
 )
 
 # Imports
-from database import engine, get_db, Base
-from models import UserDB, ConverterDB, AppConfig
-from schemas import UserCreate, Token, NewConverter, CalcReq, ConfigUpdate
-from auth import get_password_hash, verify_password, create_access_token, get_current_admin, get_current_user
-from market_data import update_market_data, CACHE
-from email_service import send_otp_email, generate_otp
-
-# 🔥 NEW ADDITION: Password Context for checks in main.py
-from passlib.context import CryptContext
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from database import engine, async_engine, get_db, get_async_db, Base, ensure_columns
+from models import UserDB, ConverterDB, AppConfig, PriceAlert
+from schemas import UserCreate, Token, NewConverter, CalcReq, ConfigUpdate, AlertCreate, DeviceToken
+from auth import get_password_hash, verify_password, hash_password_async, verify_password_async, create_access_token, get_current_admin, get_current_user, invalidate_user, Principal
+from market_data import update_market_data, current_prices, CACHE
+from pricing import price_batch, resolve_usd_rate, spot_snapshot
+from catalog_index import CATALOG, CATALOG_COLUMNS, bump_catalog_version
+import catalog_io
+from image_uploads import UPLOADS, UPLOAD_DIR, save_local, local_url
+import image_variants
+from image_variants import CachedStaticFiles
+from config_cache import CONFIG
+import live_rates
+import http_client
+from live_push import HUB, HEARTBEAT_SECONDS
+from price_history import HISTORY
+import metrics
+from metrics import MetricsMiddleware
+from email_service import send_otp_email, generate_otp, OUTBOX, OTP_TTL_MINUTES
+from rate_limit import OTP_LIMITER, client_ip
+from fcm_dispatcher import FCM
+from alerts import ALERTS, instrument_names
 
 # Init DB
 Base.metadata.create_all(bind=engine)
+ensure_columns("app_config", {"version": "INTEGER DEFAULT 1", "catalog_version": "INTEGER DEFAULT 1"})
+ensure_columns("converters", {"image_thumb": "VARCHAR", "image_medium": "VARCHAR"})
+ensure_columns("email_outbox", {"expires_at": "TIMESTAMP"})
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 app = FastAPI()
 app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_credentials=True, allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(MetricsMiddleware)
+metrics.instrument_engine(engine)
+metrics.instrument_engine(async_engine.sync_engine)
 
-UPLOAD_DIR = "static/images"
 os.makedirs(UPLOAD_DIR, exist_ok=True)
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", CachedStaticFiles(directory="static"), name="static")
 
 
 # --- 🧠 HELPER & CALCULATOR LOGIC (SAME AS BEFORE) ---
-def get_app_config(db: Session):
-    return db.query(AppConfig).first()
-
-def calculate_payout_logic(weight, pt, pd, rh, currency, db: Session, margin_override=None, days_override=None, factor_override=None, custom_usd=0.0):
-    conf = get_app_config(db)
-    c_margin = margin_override if margin_override is not None else conf.default_margin
-    c_days = days_override if days_override is not None else conf.default_days_out
-    c_factor = factor_override if factor_override is not None else conf.factor_converter
-
-    spot_prices = CACHE.get('pgm_prices', {"pt":0,"pd":0,"rh":0})
-    raw_data = CACHE.get('data', {}).get('raw', {})
-    usd_rate = custom_usd if custom_usd > 0.1 else raw_data.get("usd_rate", 86.5)
-
-    price_pt = spot_prices.get("pt", 0.0) * c_factor
-    price_pd = spot_prices.get("pd", 0.0) * c_factor
-    price_rh = spot_prices.get("rh", 0.0) * c_factor
-
-    grams_pt = (pt / 1000) * weight; oz_pt = grams_pt / 31.1035
-    grams_pd = (pd / 1000) * weight; oz_pd = grams_pd / 31.1035
-    grams_rh = (rh / 1000) * weight; oz_rh = grams_rh / 31.1035
-
-    val_pt = oz_pt * price_pt
-    val_pd = oz_pd * price_pd
-    val_rh = oz_rh * price_rh
-    
-    payout_pt = val_pt * (c_margin / 100)
-    payout_pd = val_pd * (c_margin / 100)
-    payout_rh = val_rh * (c_margin / 100)
-
-    int_pt = 0.0; int_pd = 0.0; int_rh = 0.0
-    if c_days > 0:
-        int_pt = payout_pt * (conf.interest_pt / 100) * (c_days / 365)
-        int_pd = payout_pd * (conf.interest_pd / 100) * (c_days / 365)
-        int_rh = payout_rh * (conf.interest_rh / 100) * (c_days / 365)
-    
-    total_interest = int_pt + int_pd + int_rh
-    total_payout_usd = (payout_pt + payout_pd + payout_rh) - total_interest
-
-    final_payout = total_payout_usd
-    if currency == "INR": final_payout *= usd_rate; total_interest *= usd_rate
-
+def get_app_config():
+    # Cached snapshot, no DB hit (see config_cache.py)
+    return CONFIG.get()
+
+def calculate_payout_logic(weight, pt, pd, rh, currency, margin_override=None, days_override=None, factor_override=None, custom_usd=0.0):
+    conf = get_app_config()
+    calc = price_batch(
+        [weight], [pt], [pd], [rh], conf, spot_snapshot(CACHE), resolve_usd_rate(CACHE, custom_usd), currency,
+        margin=margin_override, days=days_override, factor=factor_override
+    )
     return {
-        "final_price": round(final_payout, 2),
-        "interest": round(total_interest, 2),
-        "rates": {"pt": price_pt, "pd": price_pd, "rh": price_rh},
-        "usd_rate": usd_rate,
-        "params": {"margin": c_margin, "days": c_days, "factor": c_factor}
+        "final_price": float(calc["final_price"][0]),
+        "interest": float(calc["interest"][0]),
+        "rates": calc["rates"],
+        "usd_rate": calc["usd_rate"],
+        "params": calc["params"]
     }
 
 # --- ⚙️ ADMIN CONFIG ENDPOINTS ---
@@ -114,30 +103,84 @@ def update_config_api(c: ConfigUpdate, db: Session = Depends(get_db), user: str
     conf.factor_calculator = c.factor_calculator
     conf.factor_converter = c.factor_converter
     conf.factor_market = c.factor_market
+    conf.version = AppConfig.version + 1
     db.commit()
+    # Write-through: this worker sees the change now, others on their next poll
+    CONFIG.set_from_row(conf)
     return {"success": True}
 
 # --- 🔍 SEARCH API ---
-@app.get("/converters/search")
-def search(q: str = "", currency: str = "USD", db: Session = Depends(get_db)):
-    query = db.query(ConverterDB)
+SEARCH_STREAM_CHUNK = 500
+
+def _search_query(db: Session, q: str, after_id: Optional[int] = None):
+    query = db.query(*[getattr(ConverterDB, c) for c in CATALOG_COLUMNS])
     if q: query = query.filter(or_(ConverterDB.serial.ilike(f"%{q}%"), ConverterDB.brand.ilike(f"%{q}%")))
-    
-    conf = get_app_config(db)
-    res = []
-    for item in query.all():
-        calc = calculate_payout_logic(
-            item.weight_kg, item.pt_ppm, item.pd_ppm, item.rh_ppm, currency, db,
-            margin_override=conf.default_margin,
-            days_override=conf.default_days_out,
-            factor_override=conf.factor_converter
-        )
-        res.append({
-            "serial": item.serial, "brand": item.brand, "image": item.image,"weight": item.weight_kg,
-            "calculated_price": calc['final_price'],
-            "ppm": {"pt": item.pt_ppm, "pd": item.pd_ppm, "rh": item.rh_ppm} 
-        })
-    return res
+    if after_id is not None: query = query.filter(ConverterDB.id > after_id)
+    return query
+
+def _price_rows(rows, conf, spot_prices, usd_rate, currency):
+    if not rows: return []
+    # One config + one spot snapshot, one vectorized pass for the whole batch
+    _, serials, brands, images, weights, pts, pds, rhs, thumbs, mediums = zip(*rows)
+    prices = price_batch(weights, pts, pds, rhs, conf, spot_prices, usd_rate, currency)["final_price"].tolist()
+    return [
+        {
+            "serial": serials[i], "brand": brands[i], "image": images[i], "weight": weights[i],
+            "image_thumb": thumbs[i], "image_medium": mediums[i],
+            "calculated_price": prices[i],
+            "ppm": {"pt": pts[i], "pd": pds[i], "rh": rhs[i]}
+        }
+        for i in range(len(rows))
+    ]
+
+def _stream_search(q: str, currency: str, cursor: Optional[int], limit: Optional[int]):
+    conf, spot_prices, usd_rate = get_app_config(), spot_snapshot(CACHE), resolve_usd_rate(CACHE)
+    if CATALOG.ready:
+        rows = CATALOG.page(q, after_id=cursor, limit=limit)
+        for i in range(0, len(rows), SEARCH_STREAM_CHUNK):
+            items = _price_rows(rows[i:i + SEARCH_STREAM_CHUNK], conf, spot_prices, usd_rate, currency)
+            yield "".join(json.dumps(item) + "\n" for item in items)
+        return
+
+    # Own session: the request-scoped one is closed before a streamed body finishes
+    db = SessionLocal()
+    try:
+        query = _search_query(db, q, cursor).order_by(ConverterDB.id)
+        if limit is not None: query = query.limit(limit)
+        stmt = query.statement
+        for chunk in db.execute(stmt.execution_options(yield_per=SEARCH_STREAM_CHUNK)).partitions():
+            items = _price_rows(chunk, conf, spot_prices, usd_rate, currency)
+            yield "".join(json.dumps(item) + "\n" for item in items)
+    finally:
+        db.close()
+
+@app.get("/converters/search")
+def search(q: str = "", currency: str = "USD", limit: Optional[int] = Query(None, ge=1, le=1000), cursor: Optional[int] = None, stream: bool = False, db: Session = Depends(get_db)):
+    # NDJSON mode: one priced converter per line, flushed chunk by chunk
+    if stream:
+        return StreamingResponse(_stream_search(q, currency, cursor, limit), media_type="application/x-ndjson")
+
+    paginated = limit is not None or cursor is not None
+    # One extra row tells us whether another page exists
+    fetch = limit + 1 if limit is not None else None
+    if CATALOG.ready:
+        rows = CATALOG.page(q, after_id=cursor, limit=fetch) if paginated else CATALOG.search(q)
+    else:
+        # Cold start: index not loaded yet, scan the table
+        query = _search_query(db, q, cursor)
+        if paginated:
+            query = query.order_by(ConverterDB.id)
+            if fetch is not None: query = query.limit(fetch)
+        rows = query.all()
+    has_more = limit is not None and len(rows) > limit
+    if has_more: rows = rows[:limit]
+
+    items = _price_rows(rows, get_app_config(), spot_snapshot(CACHE), resolve_usd_rate(CACHE), currency)
+    if not paginated: return items
+
+    # Keyset pagination on ConverterDB.id
+    next_cursor = rows[-1][0] if has_more else None
+    return {"items": items, "next_cursor": next_cursor}
 
 # --- 🧮 CALCULATOR API ---
 class CalculatorRequest(BaseModel):
@@ -146,50 +189,28 @@ class CalculatorRequest(BaseModel):
     use_custom_price: bool = False; custom_pt: float=0; custom_pd: float=0; custom_rh: float=0; custom_usd: float=0
 
 @app.post("/calculate")
-def calculate_manual(req: CalculatorRequest, db: Session = Depends(get_db)):
+def calculate_manual(req: CalculatorRequest):
     if req.use_custom_price:
-        conf = get_app_config(db)
-        c_margin = req.margin_percent if req.margin_percent is not None else conf.default_margin
-        c_days = req.days_out if req.days_out is not None else conf.default_days_out
-        
-        raw_data = CACHE.get('data', {}).get('raw', {})
-        usd_rate = req.custom_usd if req.custom_usd > 0.1 else raw_data.get("usd_rate", 86.5)
-
-        grams_pt = (req.pt_ppm / 1000) * req.weight
-        val_pt = (grams_pt / 31.1035) * req.custom_pt
-        payout_pt = val_pt * (c_margin / 100)
-        
-        grams_pd = (req.pd_ppm / 1000) * req.weight
-        val_pd = (grams_pd / 31.1035) * req.custom_pd
-        payout_pd = val_pd * (c_margin / 100)
-        
-        grams_rh = (req.rh_ppm / 1000) * req.weight
-        val_rh = (grams_rh / 31.1035) * req.custom_rh
-        payout_rh = val_rh * (c_margin / 100)
-
-        int_pt = 0.0; int_pd = 0.0; int_rh = 0.0
-        if c_days > 0:
-            int_pt = payout_pt * (conf.interest_pt / 100) * (c_days / 365)
-            int_pd = payout_pd * (conf.interest_pd / 100) * (c_days / 365)
-            int_rh = payout_rh * (conf.interest_rh / 100) * (c_days / 365)
-            
-        total_interest = int_pt + int_pd + int_rh
-        final_payout_usd = (payout_pt + payout_pd + payout_rh) - total_interest
-
-        if req.currency == "INR":
-            final_payout_usd *= usd_rate
-            total_interest *= usd_rate
+        conf = get_app_config()
+        usd_rate = resolve_usd_rate(CACHE, req.custom_usd)
+
+        # Custom spot prices are used as-is (no market factor)
+        calc = price_batch(
+            [req.weight], [req.pt_ppm], [req.pd_ppm], [req.rh_ppm], conf,
+            {"pt": req.custom_pt, "pd": req.custom_pd, "rh": req.custom_rh}, usd_rate, req.currency,
+            margin=req.margin_percent, days=req.days_out, factor=1.0
+        )
 
         return {
-            "final_price": round(final_payout_usd, 2),
-            "interest_amount": round(total_interest, 2),
+            "final_price": float(calc["final_price"][0]),
+            "interest_amount": float(calc["interest"][0]),
             "rates_used": {"usd": usd_rate, "pt": req.custom_pt, "pd": req.custom_pd, "rh": req.custom_rh},
             "is_custom": True
         }
     else:
-        conf = get_app_config(db)
+        conf = get_app_config()
         calc = calculate_payout_logic(
-            req.weight, req.pt_ppm, req.pd_ppm, req.rh_ppm, req.currency, db,
+            req.weight, req.pt_ppm, req.pd_ppm, req.rh_ppm, req.currency,
             req.margin_percent, req.days_out, factor_override=conf.factor_calculator
         )
         return {
@@ -201,47 +222,153 @@ def calculate_manual(req: CalculatorRequest, db: Session = Depends(get_db)):
 
 # --- 📈 LIVE RATES API ---
 @app.get("/live_rates")
-def get_rates(db: Session = Depends(get_db)):
-    conf = get_app_config(db)
-    factor = conf.factor_market
-    original_data = CACHE["data"]
-    response_data = {
-        "metals": [], "energy": original_data.get("energy", []), 
-        "forex": original_data.get("forex", []), "raw": original_data.get("raw", {}),
-        "ai_insight": original_data.get("ai_insight", {})
-    }
-    for m in original_data.get("metals", []):
-        new_m = m.copy()
-        if m['name'] in ["Platinum", "Palladium", "Rhodium"]:
-            new_m['price'] = m['price'] * factor
-        response_data['metals'].append(new_m)
-    return response_data
-
-from scheduler import start_scheduler
-from firebase_admin import messaging
+async def get_rates(request: Request):
+    # Pre-serialized by the market loop; conditional GET answers 304 on unchanged data
+    snap = live_rates.current(CACHE["data"])
+    headers = {"ETag": snap.etag, "Cache-Control": "no-cache"}
+    if live_rates.etag_matches(request.headers.get("if-none-match"), snap.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=snap.body, media_type="application/json", headers=headers)
+
+# --- 📊 METRICS ---
+@app.get("/metrics")
+def get_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# --- 🗄️ PRICE HISTORY API ---
+def _naive_utc(dt):
+    if dt is None or dt.tzinfo is None: return dt
+    return dt.astimezone(timezone.utc).replace(tzinfo=None)
+
+@app.get("/history/{name}")
+def get_history(name: str, tier: str = Query("1h", pattern="^(1m|1h|1d)$"), start: Optional[datetime] = None, end: Optional[datetime] = None, limit: int = Query(500, ge=1, le=5000), db: Session = Depends(get_db)):
+    bars = HISTORY.query(db, name, tier, _naive_utc(start), _naive_utc(end), limit)
+    return {"name": name, "tier": tier, "bars": bars}
+
+@app.websocket("/ws/live_rates")
+async def ws_live_rates(ws: WebSocket):
+    await ws.accept()
+    sub = HUB.subscribe()
+
+    async def sender():
+        async for msg in HUB.stream(sub):
+            await ws.send_text(msg.decode())
+
+    async def receiver():
+        # Clients don't send anything; reading is how a close frame gets noticed
+        while True:
+            if (await ws.receive())["type"] == "websocket.disconnect": return
+
+    tasks = [asyncio.create_task(sender()), asyncio.create_task(receiver())]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for t in done:
+            if not t.cancelled() and isinstance(t.exception(), Exception) and not isinstance(t.exception(), WebSocketDisconnect):
+                print(f"Live WS Error: {t.exception()!r}")
+    finally:
+        for t in tasks: t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        HUB.unsubscribe(sub)
+
+@app.get("/live_rates/stream")
+async def sse_live_rates():
+    async def events():
+        sub = HUB.subscribe()
+        try:
+            async for msg in HUB.stream(sub, heartbeat=HEARTBEAT_SECONDS):
+                # Comment line keeps idle proxies from closing the connection
+                yield b": ping\n\n" if msg is None else b"data: " + msg + b"\n\n"
+        finally:
+            HUB.unsubscribe(sub)
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+from scheduler import start_scheduler, init_firebase
+import shared_state
+
+def _start_market_engine():
+    asyncio.create_task(update_market_data())
+    asyncio.create_task(ALERTS.run())
+    start_scheduler()
+    UPLOADS.recover()
 
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(update_market_data())
-    start_scheduler()
+    await http_client.startup()
+    UPLOADS.start()
+    OUTBOX.start()
+    FCM.start()
+    init_firebase()
+    # One elected worker runs the market engine, alerts and upload recovery; others follow its snapshot
+    asyncio.create_task(shared_state.run_market_role(on_leader=_start_market_engine))
     db = SessionLocal()
     if not db.query(AppConfig).first():
         db.add(AppConfig(id=1))
         db.commit()
+    CONFIG.set_from_row(db.query(AppConfig).first())
+    asyncio.create_task(CONFIG.watch())
+    CATALOG.load_from_db(db)
+    asyncio.create_task(CATALOG.watch())
     db.close()
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    await http_client.shutdown()
+    image_variants.shutdown()
+    await async_engine.dispose()
+
 class TokenReq(BaseModel):
     token: str
 
 @app.post("/update-token")
-def update_token(req: TokenReq):
-    try:
-        response = messaging.subscribe_to_topic([req.token], "all_users")
-        print(f"Subscribed token: {response.success_count} success")
+async def update_token(req: TokenReq):
+    # Coalesced with other tokens into one subscribe call (up to 1000 per call)
+    if await FCM.subscribe(req.token, "all_users"):
         return {"success": True}
-    except Exception as e:
-        print(f"Token Sub Error: {e}")
-        return {"success": False, "error": str(e)}
+    return {"success": False, "error": "Token subscription failed"}
+
+
+# --- 🔔 PRICE ALERTS (per user, evaluated on the market leader) ---
+MAX_ALERTS_PER_USER = int(os.getenv("MAX_ALERTS_PER_USER", "50"))
+
+def _alert_out(a):
+    return {"id": a.id, "instrument": a.instrument, "kind": a.kind, "value": a.value, "reference": a.reference,
+            "triggered_at": a.triggered_at.isoformat() + "Z" if a.triggered_at else None}
+
+@app.get("/alerts")
+def list_alerts(db: Session = Depends(get_db), user: Principal = Depends(get_current_user)):
+    rows = db.query(PriceAlert).filter(PriceAlert.user_id == user.id, PriceAlert.active.is_(True)).order_by(PriceAlert.id)
+    return [_alert_out(a) for a in rows]
+
+@app.post("/alerts")
+def create_alert(req: AlertCreate, db: Session = Depends(get_db), user: Principal = Depends(get_current_user)):
+    if req.instrument not in instrument_names(): raise HTTPException(400, "Unknown instrument")
+    reference = None
+    if req.kind == "change_pct":
+        reference = current_prices().get(req.instrument)
+        if not reference: raise HTTPException(503, "No live price for this instrument yet")
+    if db.query(PriceAlert).filter(PriceAlert.user_id == user.id, PriceAlert.active.is_(True)).count() >= MAX_ALERTS_PER_USER:
+        raise HTTPException(400, f"Alert limit reached ({MAX_ALERTS_PER_USER})")
+    now = datetime.utcnow()
+    alert = PriceAlert(user_id=user.id, instrument=req.instrument, kind=req.kind, value=req.value, reference=reference, active=True, created_at=now, updated_at=now)
+    db.add(alert)
+    db.commit()
+    return _alert_out(alert)
+
+@app.delete("/alerts/{alert_id}")
+def delete_alert(alert_id: int, db: Session = Depends(get_db), user: Principal = Depends(get_current_user)):
+    # Soft delete so the leader's incremental sync sees it
+    n = db.query(PriceAlert).filter(PriceAlert.id == alert_id, PriceAlert.user_id == user.id, PriceAlert.active.is_(True)) \
+        .update({"active": False, "updated_at": datetime.utcnow()})
+    db.commit()
+    if not n: raise HTTPException(404, "Alert not found")
+    return {"success": True}
+
+@app.post("/alerts/devices")
+async def register_alert_device(req: DeviceToken, user: Principal = Depends(get_current_user)):
+    # Alerts are sent to the per-user topic, so every device of the user gets them
+    if await FCM.subscribe(req.token, f"user_{user.id}"):
+        return {"success": True}
+    return {"success": False, "error": "Token subscription failed"}
 
 
 # ==========================================
@@ -269,11 +396,13 @@ class CompleteSignupRequest(BaseModel):
 
 # 👉 1. SEND OTP API (New Signup + Resend Logic)
 @app.post("/auth/send-otp")
-async def send_otp(email: str, full_name: str = "User", db: Session = Depends(get_db)):
+async def send_otp(request: Request, email: str, full_name: str = "User", db: AsyncSession = Depends(get_async_db)):
     email = email.lower()
     current_time = datetime.utcnow()
+    # Cooldown + per-IP budget, before any DB read or ghost-user insert
+    await OTP_LIMITER.check("send-otp", email, client_ip(request))
     
-    user = db.query(UserDB).filter(UserDB.email == email).first()
+    user = (await db.execute(select(UserDB).where(UserDB.email == email))).scalar_one_or_none()
 
     if user:
         # Check if Registration Complete
@@ -281,35 +410,18 @@ async def send_otp(email: str, full_name: str = "User", db: Session = Depends(ge
              raise HTTPException(status_code=400, detail="Email already registered. Please Login.")
         
         # Resend Logic for Ghost Users
-        # 🔥 FIX: Handle NoneType for attempts
-        current_attempts = user.otp_attempts if user.otp_attempts is not None else 0
-
-        if user.otp_created_at:
-            time_diff = (current_time - user.otp_created_at).total_seconds() / 60
-            if current_attempts == 1 and time_diff < 1:
-                wait_sec = int(60 - (time_diff * 60))
-                raise HTTPException(status_code=429, detail=f"Please wait {wait_sec} seconds before resending.")
-            elif 2 <= current_attempts < 5 and time_diff < 5:
-                raise HTTPException(status_code=429, detail="Please wait 5 minutes before resending.")
-            elif current_attempts >= 5:
-                if time_diff < 30:
-                    raise HTTPException(status_code=429, detail="Too many attempts. Try again after 30 minutes.")
-                else:
-                    current_attempts = 0 # Reset locally
-
         otp = generate_otp()
         user.otp = otp
         user.otp_created_at = current_time
-        # 🔥 FIX: Increment safely
-        user.otp_attempts = current_attempts + 1
-        db.commit()
+        await db.commit()
+        await OTP_LIMITER.sent(email)
         
         await send_otp_email(email, otp)
         return {"message": "OTP sent/resent successfully"}
 
     else:
         # New User (Check for First User Admin Rule)
-        user_count = db.query(UserDB).count()
+        user_count = await db.scalar(select(func.count()).select_from(UserDB))
         role = "admin" if user_count == 0 else "user"
 
         otp = generate_otp()
@@ -323,18 +435,20 @@ async def send_otp(email: str, full_name: str = "User", db: Session = Depends(ge
             role=role # Set role here
         )
         db.add(new_user)
-        db.commit()
+        await db.commit()
+        await OTP_LIMITER.sent(email)
         
         await send_otp_email(email, otp)
         return {"message": "OTP sent successfully"}
 
 @app.post("/auth/forgot-password-otp")
-async def forgot_password_otp(email: str, db: Session = Depends(get_db)):
+async def forgot_password_otp(request: Request, email: str, db: AsyncSession = Depends(get_async_db)):
     email = email.lower()
     current_time = datetime.utcnow()
+    await OTP_LIMITER.check("forgot-password-otp", email, client_ip(request))
     
     # 1. Check User
-    user = db.query(UserDB).filter(UserDB.email == email).first()
+    user = (await db.execute(select(UserDB).where(UserDB.email == email))).scalar_one_or_none()
 
     # Agar User nahi hai -> Error
     if not user:
@@ -344,31 +458,12 @@ async def forgot_password_otp(email: str, db: Session = Depends(get_db)):
     if not user.hashed_password:
         raise HTTPException(status_code=400, detail="Account incomplete. Please Sign Up first.")
 
-    # 🔥 FIX: Handle NoneType for attempts
-    current_attempts = user.otp_attempts if user.otp_attempts is not None else 0
-
-    # 2. Resend Time Logic (Wahi same logic)
-    if user.otp_created_at:
-        time_diff = (current_time - user.otp_created_at).total_seconds() / 60
-        
-        if current_attempts == 1 and time_diff < 1:
-            wait_sec = int(60 - (time_diff * 60))
-            raise HTTPException(status_code=429, detail=f"Please wait {wait_sec} seconds before resending.")
-        elif 2 <= current_attempts < 5 and time_diff < 5:
-            raise HTTPException(status_code=429, detail="Please wait 5 minutes before resending.")
-        elif current_attempts >= 5:
-            if time_diff < 30:
-                raise HTTPException(status_code=429, detail="Too many attempts. Try again after 30 minutes.")
-            else:
-                current_attempts = 0 # Reset locally
-
-    # 3. Send OTP
+    # 2. Send OTP (resend cooldown already checked by OTP_LIMITER)
     otp = generate_otp()
     user.otp = otp
     user.otp_created_at = current_time
-    # 🔥 FIX: Increment safely
-    user.otp_attempts = current_attempts + 1
-    db.commit()
+    await db.commit()
+    await OTP_LIMITER.sent(email)
     
     await send_otp_email(email, otp)
     return {"message": "OTP sent to your email."}
@@ -376,12 +471,12 @@ async def forgot_password_otp(email: str, db: Session = Depends(get_db)):
 
 # 👉 2. VERIFY OTP API
 @app.post("/auth/verify-otp")
-async def verify_otp(req: VerifyOTPRequest, db: Session = Depends(get_db)):
+async def verify_otp(req: VerifyOTPRequest, db: AsyncSession = Depends(get_async_db)):
     email = req.email.lower()
     otp_input = req.otp.strip()
     current_time = datetime.utcnow()
 
-    user = db.query(UserDB).filter(UserDB.email == email).first()
+    user = (await db.execute(select(UserDB).where(UserDB.email == email))).scalar_one_or_none()
     
     if not user:
         raise HTTPException(status_code=400, detail="User not found or OTP expired.")
@@ -391,23 +486,25 @@ async def verify_otp(req: VerifyOTPRequest, db: Session = Depends(get_db)):
 
     if user.otp_created_at:
         time_diff = (current_time - user.otp_created_at).total_seconds() / 60
-        if time_diff > 10:
+        if time_diff > OTP_TTL_MINUTES:
              raise HTTPException(status_code=400, detail="OTP Expired. Please request a new one.")
 
     user.is_verified = True
     user.otp = None         
     user.otp_attempts = 0   
-    db.commit()              
+    await db.commit()              
+    invalidate_user(user.email)
+    await OTP_LIMITER.reset(email)
 
     return {"message": "Email Verified Successfully. Please set your password."}
 
 
 # 👉 3. COMPLETE SIGNUP (Set Password for New User)
 @app.post("/auth/complete-signup")
-async def complete_signup(req: CompleteSignupRequest, db: Session = Depends(get_db)):
+async def complete_signup(req: CompleteSignupRequest, db: AsyncSession = Depends(get_async_db)):
     email = req.email.lower()
     
-    user = db.query(UserDB).filter(UserDB.email == email).first()
+    user = (await db.execute(select(UserDB).where(UserDB.email == email))).scalar_one_or_none()
     
     if not user:
         raise HTTPException(status_code=400, detail="User not found")
@@ -415,9 +512,10 @@ async def complete_signup(req: CompleteSignupRequest, db: Session = Depends(get_
     if not user.is_verified:
         raise HTTPException(status_code=400, detail="Email not verified. Verify OTP first.")
 
-    user.hashed_password = get_password_hash(req.password)
+    user.hashed_password = await hash_password_async(req.password)
     user.full_name = req.full_name 
-    db.commit()
+    await db.commit()
+    invalidate_user(user.email)
 
     access_token = create_access_token({"sub": user.email})
     return {
@@ -431,12 +529,12 @@ async def complete_signup(req: CompleteSignupRequest, db: Session = Depends(get_
 
 # 👉 4. RESET PASSWORD (Forgot Password Flow)
 @app.post("/auth/reset-password")
-async def reset_password(req: ResetPasswordRequest, db: Session = Depends(get_db)):
+async def reset_password(req: ResetPasswordRequest, db: AsyncSession = Depends(get_async_db)):
     email = req.email.lower()
     otp_input = req.otp.strip()
     current_time = datetime.utcnow()
 
-    user = db.query(UserDB).filter(UserDB.email == email).first()
+    user = (await db.execute(select(UserDB).where(UserDB.email == email))).scalar_one_or_none()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
@@ -445,23 +543,20 @@ async def reset_password(req: ResetPasswordRequest, db: Session = Depends(get_db
 
     if user.otp_created_at:
         time_diff = (current_time - user.otp_created_at).total_seconds() / 60
-        if time_diff > 10:
+        if time_diff > OTP_TTL_MINUTES:
             raise HTTPException(status_code=400, detail="OTP Expired. Please request a new one.")
     
-    try:
-        if user.hashed_password and pwd_context.verify(req.new_password, user.hashed_password):
-            raise HTTPException(status_code=400, detail="New password cannot be the same as the old password.")
-    except HTTPException as he:
-        raise he  # Agar "Same Password" wala error hai, toh usse dikhao
-    except Exception:
-        pass  # Agar "UnknownHashError" aya, toh ignore karo (User ko reset karne do)
-    # 🔥 CRASH FIX END
-
-    user.hashed_password = get_password_hash(req.new_password)
+    # Unknown/legacy hash formats verify as False, so the reset still goes through
+    if user.hashed_password and await verify_password_async(req.new_password, user.hashed_password):
+        raise HTTPException(status_code=400, detail="New password cannot be the same as the old password.")
+
+    user.hashed_password = await hash_password_async(req.new_password)
     user.otp = None
     user.otp_attempts = 0
     user.is_verified = True
-    db.commit()
+    await db.commit()
+    invalidate_user(user.email)
+    await OTP_LIMITER.reset(email)
 
     return {"message": "Password reset successfully. You can now login."}
 
@@ -470,17 +565,20 @@ async def reset_password(req: ResetPasswordRequest, db: Session = Depends(get_db
 @app.post("/auth/change-password")
 async def change_password(
     req: ChangePasswordRequest, 
-    db: Session = Depends(get_db), 
-    current_user: UserDB = Depends(get_current_user) # 👈 Now imported correctly
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: Principal = Depends(get_current_user) # 👈 Now imported correctly
 ):
-    if not verify_password(req.old_password, current_user.hashed_password):
+    user = await db.get(UserDB, current_user.id)
+    if user is None: raise HTTPException(status_code=401, detail="User not found")
+    if not await verify_password_async(req.old_password, user.hashed_password):
         raise HTTPException(status_code=400, detail="Incorrect old password")
 
     if req.old_password == req.new_password:
         raise HTTPException(status_code=400, detail="New password cannot be the same as old password")
 
-    current_user.hashed_password = get_password_hash(req.new_password)
-    db.commit()
+    user.hashed_password = await hash_password_async(req.new_password)
+    await db.commit()
+    invalidate_user(user.email)
 
     return {"message": "Password changed successfully"}
 
@@ -554,28 +652,51 @@ def google_auth(req: GoogleAuthReq, db: Session = Depends(get_db)):
 
 # --- ADMIN ROUTES ---
 @app.post("/admin/add_converter")
-def add_conv(serial: str = Form(...), brand: str = Form(...), weight_kg: float = Form(...), pt_ppm: float = Form(...), pd_ppm: float = Form(...), rh_ppm: float = Form(...), image: UploadFile = File(...), db: Session = Depends(get_db), u: str = Depends(get_current_admin)):
+def add_conv(request: Request, serial: str = Form(...), brand: str = Form(...), weight_kg: float = Form(...), pt_ppm: float = Form(...), pd_ppm: float = Form(...), rh_ppm: float = Form(...), image: UploadFile = File(...), db: Session = Depends(get_db), u: str = Depends(get_current_admin)):
+    # Save locally and serve that copy until the background upload swaps it
+    try: path = save_local(image.file, image.filename)
+    except Exception as e: raise HTTPException(500, f"Image Save Failed: {e}")
+    image_url = local_url(path, str(request.base_url))
+
+    conv = ConverterDB(serial=serial, brand=brand, image=image_url, weight_kg=weight_kg, pt_ppm=pt_ppm, pd_ppm=pd_ppm, rh_ppm=rh_ppm)
+    db.add(conv)
     try:
-        res = cloudinary.uploader.upload(image.file, folder="converters")
-        image_url = res.get("secure_url")
-    except Exception as e:
-        raise HTTPException(500, f"Image Upload Failed: {e}")
-
-    db.add(ConverterDB(serial=serial, brand=brand, image=image_url, weight_kg=weight_kg, pt_ppm=pt_ppm, pd_ppm=pd_ppm, rh_ppm=rh_ppm))
-    try: db.commit()
-    except: raise HTTPException(400, "Exists")
-    return {"success": True}
+        version = bump_catalog_version(db)
+        db.commit()
+    except:
+        os.remove(path)
+        raise HTTPException(400, "Exists")
+    CATALOG.upsert(tuple(getattr(conv, c) for c in CATALOG_COLUMNS), version)
+    UPLOADS.submit(serial, path, image_url)
+    return {"success": True, "image": image_url}
+
+@app.post("/admin/converters/import")
+def import_converters(file: UploadFile = File(...), format: Optional[str] = Query(None, pattern="^(csv|jsonl)$"), u: str = Depends(get_current_admin)):
+    fmt = catalog_io.detect_format(file.filename, format)
+    # Decode the spooled upload line by line rather than reading it whole
+    text = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try: return catalog_io.import_stream(text, fmt)
+    finally: text.detach()
+
+@app.get("/admin/converters/export")
+def export_converters(format: str = Query("csv", pattern="^(csv|jsonl)$"), u: str = Depends(get_current_admin)):
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="converters.{format}"'}
+    return StreamingResponse(catalog_io.export_stream(format), media_type=media_type, headers=headers)
 
 @app.delete("/admin/delete_converter/{serial}")
 def delete_conv(serial: str, db: Session = Depends(get_db), u: str = Depends(get_current_admin)):
     db.query(ConverterDB).filter(ConverterDB.serial == serial).delete()
+    version = bump_catalog_version(db)
     db.commit()
+    CATALOG.remove_serial(serial, version)
     return {"success": True}
 
 @app.post("/admin/create_admin")
 def create_adm(user: UserCreate, db: Session = Depends(get_db), u: str = Depends(get_current_admin)):
     if db.query(UserDB).filter(UserDB.email == user.email).first(): raise HTTPException(400, "Taken")
     db.add(UserDB(full_name=user.full_name, email=user.email, hashed_password=get_password_hash(user.password), role="admin")); db.commit()
+    invalidate_user(user.email)
     return {"success": True}
 
 class UpdateProfileRequest(BaseModel):
@@ -584,16 +705,19 @@ class UpdateProfileRequest(BaseModel):
 @app.put("/auth/update-profile")
 async def update_profile(
     req: UpdateProfileRequest, 
-    db: Session = Depends(get_db), 
-    current_user: UserDB = Depends(get_current_user)
+    db: AsyncSession = Depends(get_async_db), 
+    current_user: Principal = Depends(get_current_user)
 ):
+    user = await db.get(UserDB, current_user.id)
+    if user is None: raise HTTPException(status_code=401, detail="User not found")
     # Sirf Name update karega, Email nahi chhedega
-    current_user.full_name = req.full_name
-    db.commit()
+    user.full_name = req.full_name
+    await db.commit()
+    invalidate_user(user.email)
     
     return {
         "message": "Profile updated successfully", 
-        "name": current_user.full_name
+        "name": user.full_name
     }
 
 
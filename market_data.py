@@ -1,12 +1,19 @@
 import asyncio
+import os
 import time
-import requests
+import aiohttp
+from concurrent.futures import ThreadPoolExecutor
 import yfinance as yf
 import pandas as pd
 import random 
 import re
-from bs4 import BeautifulSoup
-import aiohttp
+import http_client
+from price_parsers import parse_price_async
+from yahoo_quotes import fetch_yahoo_quotes
+from source_scheduler import SourceScheduler, SourceTask
+import live_rates
+from metrics import Gauge, PGM_SCRAPE_TOTAL, FETCHER_RESULTS
+from price_history import HISTORY
 
 # ==========================================================
 # 📋 LIVE MARKET DATA (1 HOUR RHODIUM CYCLE + 0% FIX)
@@ -43,6 +50,23 @@ CACHE = {
     },
     "pgm_prices": {"pt": 960.0, "pd": 1050.0, "rh": 4750.0}
 }
+# Placeholders shown until the first scrape; never recorded or alerted on
+PGM_DEFAULTS = dict(CACHE["pgm_prices"])
+# PGM codes whose CACHE price came from a real scrape (this session)
+SCRAPED_PGM = set()
+
+# Running engine (SourceScheduler), exposed for stats/metrics
+MARKET_ENGINE = {"scheduler": None}
+# Called after every output rebuild (e.g. shared snapshot writer)
+OUTPUT_HOOKS = []
+
+def _source_ages():
+    scheduler = MARKET_ENGINE["scheduler"]
+    if scheduler is None: return {}
+    now = time.time()
+    return {(src.name,): round(now - src.last_success_at, 3) for src in scheduler.sources if src.last_success_at}
+
+Gauge("market_source_data_age_seconds", "Seconds since each source last returned data (leader only)", ("source",), fn=_source_ages)
 
 REAL_DATA_CACHE = {} 
 # 🔥 To Calculate Percentage Change (Fix 0% Issue)
@@ -51,9 +75,14 @@ OPENING_PRICES = {"pt": None, "pd": None, "rh": None}
 # --- 1. SCRAPER LOGIC ---
 async def scrape_price(metal, urls_dict):
     price = await _fetch_html(urls_dict["primary"], "kitco")
-    if price: return price
+    if price:
+        PGM_SCRAPE_TOTAL.inc(metal, "kitco")
+        return price
     price = await _fetch_html(urls_dict["backup"], "backup")
-    if price: return price
+    if price:
+        PGM_SCRAPE_TOTAL.inc(metal, "backup")
+        return price
+    PGM_SCRAPE_TOTAL.inc(metal, "none")
     return None
 
 async def _fetch_html(url, source_type):
@@ -62,29 +91,12 @@ async def _fetch_html(url, source_type):
             "User-Agent": random.choice(USER_AGENTS),
             "Cache-Control": "max-age=0",
         }
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url, headers=headers, timeout=15) as response:
-                if response.status != 200: return None
-                html = await response.text()
-                soup = BeautifulSoup(html, "html.parser")
-                price_str = ""
-                
-                if source_type == "kitco":
-                    tag = soup.find("h3", class_=lambda c: c and "font-mulish" in c and "text-4xl" in c)
-                    if tag: price_str = tag.get_text()
-                    else:
-                        tags = soup.find_all("span", string=lambda t: t and "$" in t)
-                        for t in tags:
-                            if len(t.text) < 15: price_str = t.text; break
-                elif source_type == "backup":
-                    tag = soup.find("td", {"id": "spot-price"}) 
-                    if not tag: tag = soup.find("span", class_="price-now")
-                    if tag: price_str = tag.get_text()
-
-                if price_str:
-                    clean = price_str.replace("$", "").replace(",", "").strip()
-                    try: return float(clean)
-                    except: pass
+        # Pooled keep-alive session (see http_client.py)
+        async with http_client.get_session().get(url, headers=headers) as response:
+            if response.status != 200: return None
+            html = await response.text()
+        # Parsing runs in the parse pool, off the event loop (see price_parsers.py)
+        return await parse_price_async(html, source_type)
     except: pass
     return None
 
@@ -151,15 +163,31 @@ MULTIPLIERS = {
 
 INVERT_FOREX = ["EUR / USD", "GBP / USD", "AUD / USD"]
 
-def fetch_binance():
+BINANCE_URL = "https://api.binance.com/api/v3/ticker/24hr"
+BINANCE_TIMEOUT = aiohttp.ClientTimeout(total=5)
+
+# "quote": last price + previous close, incremental bars (yahoo_quotes.py)
+# "bars":  legacy 2-day 1-minute download (fetch_yahoo_batch)
+YAHOO_FETCH_MODE = os.getenv("YAHOO_FETCH_MODE", "quote")
+
+# yfinance is blocking: give it its own bounded pool so a slow download can't
+# starve the default executor that FastAPI's sync endpoints run on
+YAHOO_EXECUTOR = ThreadPoolExecutor(max_workers=int(os.getenv("YAHOO_WORKERS", "1")), thread_name_prefix="yahoo")
+
+async def fetch_binance():
+    # Async via the shared pooled session (see http_client.py)
     try:
         symbols = [item[0] for item in ALL_TICKERS if item[3] == "binance"]
         if not symbols: return {}
         sym_str = str(symbols).replace("'", '"').replace(" ", "")
-        r = requests.get(f"https://api.binance.com/api/v3/ticker/24hr?symbols={sym_str}", timeout=5)
-        if r.status_code == 200:
-            return {x['symbol']: {'price': float(x['lastPrice']), 'change': float(x['priceChange']), 'percent': float(x['priceChangePercent'])} for x in r.json()}
-    except: pass
+        async with http_client.get_session().get(BINANCE_URL, params={"symbols": sym_str}, timeout=BINANCE_TIMEOUT) as r:
+            if r.status == 200:
+                res = {x['symbol']: {'price': float(x['lastPrice']), 'change': float(x['priceChange']), 'percent': float(x['priceChangePercent'])} for x in await r.json()}
+                FETCHER_RESULTS.inc("fetch_binance", "ok")
+                return res
+            FETCHER_RESULTS.inc("fetch_binance", f"http_{r.status}")
+    except:
+        FETCHER_RESULTS.inc("fetch_binance", "error")
     return {}
 
 def fetch_yahoo_batch(tickers):
@@ -177,6 +205,13 @@ def fetch_yahoo_batch(tickers):
         return res
     except: return {}
 
+def fetch_yahoo(tickers):
+    res = fetch_yahoo_batch(tickers) if YAHOO_FETCH_MODE == "bars" else fetch_yahoo_quotes(tickers)
+    FETCHER_RESULTS.inc(f"fetch_yahoo_{YAHOO_FETCH_MODE}", "ok" if res else "empty")
+    # Tickers asked for but not returned count as per-ticker misses
+    if res: FETCHER_RESULTS.inc(f"fetch_yahoo_{YAHOO_FETCH_MODE}", "ticker_miss", amount=len(tickers) - len(res))
+    return res
+
 # --- 3. UTILS ---
 def add_noise(price):
     if price == 0: return 0
@@ -187,102 +222,128 @@ def get_ai_advice(name, percent):
     if percent < -1.0: return {"message": f"{name} is dropping!", "color": "red", "priority": 90}
     return {"message": f"{name} is stable.", "color": "grey", "priority": 10}
 
-# --- 4. MAIN LOOP ---
-async def update_market_data():
-    print("🚀 Market Data Engine Started (With 0% Fix & Admin Factors)")
+# --- 4. OUTPUT GENERATION ---
+def current_prices():
+    # Un-noised spot values keyed by PGM code / ticker symbol (history + alerts).
+    # PGM codes still on their placeholder defaults are left out.
+    prices = {code: p for code, p in CACHE["pgm_prices"].items() if code in SCRAPED_PGM}
+    for t, name, _, _ in ALL_TICKERS:
+        base = REAL_DATA_CACHE.get(name)
+        if base and base['price']: prices[t] = base['price'] * MULTIPLIERS.get(name, 1.0)
+    return prices
+
+def build_output():
+    new_data = {"metals": [], "energy": [], "forex": [], "raw": {}, "ai_insight": {}}
+    raw = {"pt": 0, "pd": 0, "rh": 0, "usd_rate": 86.5}
+    max_prio = 0
+
+    for _, name, cat, _ in ALL_TICKERS:
+        base = REAL_DATA_CACHE.get(name, {'price': 0, 'change': 0, 'percent': 0})
+        if base['price'] == 0: continue
+        
+        price = base['price']
+        if name in MULTIPLIERS: price *= MULTIPLIERS[name]
+        if name == "USD / INR": raw["usd_rate"] = price
+
+        if name in ["Gold (Spot)", "Bitcoin"]:
+            adv = get_ai_advice(name, base['percent'])
+            if adv['priority'] > max_prio: max_prio = adv['priority']; new_data['ai_insight'] = adv
+        
+        new_data[cat].append({"name": name, "price": price, "change": base['change'], "percent": base['percent'], "type": cat})
+
+    # PGM PRICES (Fluctuating Noise applied to Cached Value)
+    pt = add_noise(CACHE["pgm_prices"]["pt"])
+    pd = add_noise(CACHE["pgm_prices"]["pd"])
+    rh = add_noise(CACHE["pgm_prices"]["rh"])
     
-    loop_count = 0
-    loop = asyncio.get_event_loop()
-
-    while True:
-        try:
-            # --- STARTUP FETCH (One-time) ---
-            if loop_count == 0:
-                print(">>> [STARTUP] Fetching & Setting Base Prices...")
-                for metal in ["rh", "pd", "pt"]:
-                    val = await scrape_price(metal, URLS[metal])
-                    if val: 
-                        CACHE['pgm_prices'][metal] = val
-                        # 🔥 SET OPENING PRICE if not set
-                        if OPENING_PRICES[metal] is None: 
-                            OPENING_PRICES[metal] = val
-                            print(f"✅ Set Opening {metal.upper()}: {val}")
-                    await asyncio.sleep(2)
-
-            # --- SCHEDULED CYCLES ---
-            # 1. RHODIUM (Every 1 Hour)
-            if loop_count > 0 and loop_count % 1200 == 0: 
-                val = await scrape_price("rh", URLS["rh"])
-                if val: CACHE['pgm_prices']['rh'] = val
-            
-            # 2. PALLADIUM (Every 10 Mins)
-            if loop_count > 0 and loop_count % 200 == 40: 
-                val = await scrape_price("pd", URLS["pd"])
-                if val: CACHE['pgm_prices']['pd'] = val
-
-            # 3. PLATINUM (Every 10 Mins)
-            if loop_count > 0 and loop_count % 200 == 100: 
-                val = await scrape_price("pt", URLS["pt"])
-                if val: CACHE['pgm_prices']['pt'] = val
-                
-            # --- HIGH FREQ FETCH (Yahoo/Binance) ---
-            if loop_count % 10 == 0:
-                binance = await loop.run_in_executor(None, fetch_binance)
-                yahoo = await loop.run_in_executor(None, fetch_yahoo_batch, [t[0] for t in ALL_TICKERS if t[3]=="yahoo"])
-                
-                for t, name, _, src in ALL_TICKERS:
-                    d = binance.get(t) if src=="binance" else yahoo.get(t)
-                    if d: REAL_DATA_CACHE[name] = d
-
-            # --- OUTPUT GENERATION (3s) ---
-            new_data = {"metals": [], "energy": [], "forex": [], "raw": {}, "ai_insight": {}}
-            raw = {"pt": 0, "pd": 0, "rh": 0, "usd_rate": 86.5}
-            max_prio = 0
-
-            for _, name, cat, _ in ALL_TICKERS:
-                base = REAL_DATA_CACHE.get(name, {'price': 0, 'change': 0, 'percent': 0})
-                if base['price'] == 0: continue
-                
-                price = base['price']
-                if name in MULTIPLIERS: price *= MULTIPLIERS[name]
-                if name == "USD / INR": raw["usd_rate"] = price
-
-                if name in ["Gold (Spot)", "Bitcoin"]:
-                    adv = get_ai_advice(name, base['percent'])
-                    if adv['priority'] > max_prio: max_prio = adv['priority']; new_data['ai_insight'] = adv
-                
-                new_data[cat].append({"name": name, "price": price, "change": base['change'], "percent": base['percent'], "type": cat})
-
-            # PGM PRICES (Fluctuating Noise applied to Cached Value)
-            pt = add_noise(CACHE["pgm_prices"]["pt"])
-            pd = add_noise(CACHE["pgm_prices"]["pd"])
-            rh = add_noise(CACHE["pgm_prices"]["rh"])
-            
-            raw.update({"pt": pt/31.1035, "pd": pd/31.1035, "rh": rh/31.1035})
-
-            for code, n, p in [("rh", "Rhodium", rh), ("pd", "Palladium", pd), ("pt", "Platinum", pt)]:
-                # 🔥 Calculate % Change based on Session Opening
-                open_p = OPENING_PRICES[code]
-                percent_change = 0.0
-                change_val = 0.0
-                
-                if open_p and open_p > 0:
-                    change_val = p - open_p
-                    percent_change = (change_val / open_p) * 100
-                
-                new_data["metals"].insert(0, {
-                    "name": n, "price": p, 
-                    "change": change_val, 
-                    "percent": percent_change, # 🔥 Fixed 0% Bug (Shows deviation from session start)
-                    "type": "metals"
-                })
-
-            new_data["raw"] = raw
-            CACHE["data"] = new_data
-            
-            loop_count += 1
-            await asyncio.sleep(3)
-
-        except Exception as e:
-            print(f"Loop Error: {e}")
-            await asyncio.sleep(3)
+    raw.update({"pt": pt/31.1035, "pd": pd/31.1035, "rh": rh/31.1035})
+
+    for code, n, p in [("rh", "Rhodium", rh), ("pd", "Palladium", pd), ("pt", "Platinum", pt)]:
+        # 🔥 Calculate % Change based on Session Opening
+        open_p = OPENING_PRICES[code]
+        percent_change = 0.0
+        change_val = 0.0
+        
+        if open_p and open_p > 0:
+            change_val = p - open_p
+            percent_change = (change_val / open_p) * 100
+        
+        new_data["metals"].insert(0, {
+            "name": n, "price": p, 
+            "change": change_val, 
+            "percent": percent_change, # 🔥 Fixed 0% Bug (Shows deviation from session start)
+            "type": "metals"
+        })
+
+    new_data["raw"] = raw
+    CACHE["data"] = new_data
+    live_rates.publish(new_data)
+    HISTORY.record(current_prices())
+    for hook in OUTPUT_HOOKS: hook()
+
+# --- 5. SOURCES (Each on its own schedule, see source_scheduler.py) ---
+def _pgm_source(metal):
+    async def fetch():
+        return await scrape_price(metal, URLS[metal])
+
+    def apply(val):
+        if OPENING_PRICES[metal] is None:
+            # 🔥 SET OPENING PRICE if not set
+            OPENING_PRICES[metal] = val
+            print(f"✅ Set Opening {metal.upper()}: {val}")
+        changed = CACHE['pgm_prices'].get(metal) != val or metal not in SCRAPED_PGM
+        CACHE['pgm_prices'][metal] = val
+        SCRAPED_PGM.add(metal)
+        return changed
+    return fetch, apply
+
+def _ticker_apply(src_name):
+    def apply(quotes):
+        changed = False
+        for t, name, _, src in ALL_TICKERS:
+            d = quotes.get(t) if src == src_name else None
+            if d and REAL_DATA_CACHE.get(name) != d:
+                REAL_DATA_CACHE[name] = d
+                changed = True
+        return changed
+    return apply
+
+async def _fetch_yahoo_async():
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(YAHOO_EXECUTOR, fetch_yahoo, [t[0] for t in ALL_TICKERS if t[3]=="yahoo"])
+
+async def _noise_tick():
+    return True
+
+# PGM display noise re-rolls on real input changes only. PGM_NOISE_SECONDS > 0
+# adds a timed re-roll, but every tick then rebuilds and republishes the
+# output, so the /live_rates ETag and the push diff change each time.
+PGM_NOISE_SECONDS = float(os.getenv("PGM_NOISE_SECONDS", "0"))
+
+def market_sources():
+    sources = [
+        # Rhodium hourly, palladium/platinum every 10 mins; scrape = kitco + backup, up to 15s each
+        SourceTask("kitco-rh", *_pgm_source("rh"), interval=3600, jitter=60, timeout=40, retries=2, backoff=30),
+        SourceTask("kitco-pd", *_pgm_source("pd"), interval=600, jitter=20, timeout=40, retries=2, backoff=30),
+        SourceTask("kitco-pt", *_pgm_source("pt"), interval=600, jitter=20, timeout=40, retries=2, backoff=30),
+        SourceTask("binance", fetch_binance, _ticker_apply("binance"), interval=30, jitter=2, timeout=10, retries=1, backoff=5),
+        SourceTask("yahoo", _fetch_yahoo_async, _ticker_apply("yahoo"), interval=30, jitter=2, timeout=60, retries=1, backoff=10),
+    ]
+    if PGM_NOISE_SECONDS > 0:
+        sources.append(SourceTask("pgm-noise", _noise_tick, lambda _: True, interval=PGM_NOISE_SECONDS, retries=0))
+    return sources
+
+# --- 6. ENGINE ---
+async def update_market_data():
+    print("🚀 Market Data Engine Started (Per-Source Scheduler)")
+    loop = asyncio.get_running_loop()
+    # Restart keeps the session baseline: today's opening prices come from history
+    try: await loop.run_in_executor(None, HISTORY.restore, OPENING_PRICES, PGM_DEFAULTS)
+    except Exception as e: print(f"History Restore Error: {e}")
+    asyncio.create_task(HISTORY.run_flusher())
+
+    scheduler = SourceScheduler(market_sources())
+    MARKET_ENGINE["scheduler"] = scheduler
+    scheduler.start()
+    scheduler.changed.set()   # publish the cached defaults right away
+    await scheduler.run_output(build_output)
@@ -0,0 +1,187 @@
+import bisect
+import contextvars
+import threading
+import time
+
+# ==========================================================
+# 📊 PROMETHEUS-STYLE METRICS (Lock-free, per-thread shards)
+# ==========================================================
+# Each thread writes to its own shard (a plain dict), so recording never
+# takes a lock and never races another writer. /metrics sums the shards at
+# scrape time. Gauges are callbacks evaluated on scrape.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REGISTRY = []
+
+
+class _Sharded:
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        REGISTRY.append(self)
+
+    def _shard(self):
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            self._shards.append(shard)   # list.append is atomic
+        return shard
+
+    def _fmt_labels(self, values, extra=()):
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs: return ""
+        return "{" + ",".join(f'{k}="{str(v)}"' for k, v in pairs) + "}"
+
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        shard = self._shard()
+        shard[labels] = shard.get(labels, 0) + amount
+
+    def collect(self):
+        totals = {}
+        for shard in list(self._shards):
+            for labels, v in shard.copy().items(): totals[labels] = totals.get(labels, 0) + v
+        return [f"{self.name}{self._fmt_labels(labels)} {v}" for labels, v in sorted(totals.items())]
+
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        shard = self._shard()
+        state = shard.get(labels)
+        if state is None:
+            state = shard[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        state[0][bisect.bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def time(self, *labels):
+        return _Timer(self, labels)
+
+    def collect(self):
+        totals = {}
+        for shard in list(self._shards):
+            for labels, (counts, total, n) in shard.copy().items():
+                agg = totals.setdefault(labels, [[0] * (len(self.buckets) + 1), 0.0, 0])
+                for i, c in enumerate(list(counts)): agg[0][i] += c
+                agg[1] += total
+                agg[2] += n
+        lines = []
+        for labels, (counts, total, n) in sorted(totals.items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float("inf"),), counts):
+                cumulative += c
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{self._fmt_labels(labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{self._fmt_labels(labels)} {total}")
+            lines.append(f"{self.name}_count{self._fmt_labels(labels)} {n}")
+        return lines
+
+
+class Gauge(_Sharded):
+    kind = "gauge"
+
+    def __init__(self, name, help_text, labelnames=(), fn=None):
+        super().__init__(name, help_text, labelnames)
+        self.fn = fn   # () -> {labels_tuple: value}
+
+    def collect(self):
+        try: values = self.fn() if self.fn else {}
+        except Exception: values = {}
+        return [f"{self.name}{self._fmt_labels(labels)} {v}" for labels, v in sorted(values.items())]
+
+
+class _Timer:
+    __slots__ = ("hist", "labels", "start")
+
+    def __init__(self, hist, labels):
+        self.hist, self.labels = hist, labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start, *self.labels)
+
+
+def render():
+    out = []
+    for m in REGISTRY:
+        out.append(f"# HELP {m.name} {m.help}")
+        out.append(f"# TYPE {m.name} {m.kind}")
+        out.extend(m.collect())
+    return "\n".join(out) + "\n"
+
+
+# --- 1. HTTP / DB ---
+REQUEST_LATENCY = Histogram("http_request_duration_seconds", "Request latency per route", ("route", "method", "status"))
+REQUEST_DB_QUERIES = Histogram("http_request_db_queries", "DB queries issued per request", ("route",), buckets=(0, 1, 2, 3, 5, 10, 25, 50, 100))
+REQUEST_DB_SECONDS = Histogram("http_request_db_seconds", "Time spent in DB per request", ("route",))
+
+# [query_count, db_seconds] for the current request; a mutable list so
+# threadpool endpoints (copied context) update the same object
+DB_STATS = contextvars.ContextVar("db_stats", default=None)
+
+
+def instrument_engine(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["query_start"].pop()
+        stats = DB_STATS.get()
+        if stats is not None:
+            stats[0] += 1
+            stats[1] += time.perf_counter() - started
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: per-route latency, DB query count and DB time."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        stats = [0, 0.0]
+        token = DB_STATS.set(stats)
+        status = [500]
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start": status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            DB_STATS.reset(token)
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            REQUEST_LATENCY.observe(time.perf_counter() - start, route, scope["method"], status[0])
+            REQUEST_DB_QUERIES.observe(stats[0], route)
+            REQUEST_DB_SECONDS.observe(stats[1], route)
+
+
+# --- 2. MARKET DATA ---
+FETCH_LATENCY = Histogram("market_fetch_duration_seconds", "Per-source fetch latency", ("source",))
+FETCH_TOTAL = Counter("market_fetch_total", "Per-source fetch attempts by result", ("source", "result"))
+PGM_SCRAPE_TOTAL = Counter("pgm_scrape_total", "scrape_price outcomes (kitco / backup fallback / none)", ("metal", "via"))
+FETCHER_RESULTS = Counter("market_fetcher_results_total", "fetch_binance / fetch_yahoo outcomes", ("fetcher", "result"))
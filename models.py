@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime
+from sqlalchemy import Column, Integer, String, Float, Boolean, DateTime, UniqueConstraint
 from database import Base
 from datetime import datetime
 
@@ -21,6 +21,8 @@ class ConverterDB(Base):
     brand = Column(String, index=True)
     description = Column(String)
     image = Column(String)
+    image_thumb = Column(String, nullable=True)    # WebP variants, served from /static
+    image_medium = Column(String, nullable=True)
     weight_kg = Column(Float)
     pt_ppm = Column(Float)
     pd_ppm = Column(Float)
@@ -45,6 +47,52 @@ class AppConfig(Base):
     factor_converter = Column(Float, default=1.0)
     factor_market = Column(Float, default=1.0)
 
+    # Bumped on every admin write so other workers can detect changes cheaply
+    version = Column(Integer, default=1)
+    # Bumped on every converter write so other workers reload their search index
+    catalog_version = Column(Integer, default=1)
 
+# 📈 Price History (OHLC rollups per tier: 1m / 1h / 1d)
+class PriceBar(Base):
+    __tablename__ = "price_bars"
+    __table_args__ = (UniqueConstraint("name", "tier", "bucket", name="uq_price_bar"),)
+    id = Column(Integer, primary_key=True, index=True)
+    name = Column(String, index=True)   # "pt" / "pd" / "rh" or ticker symbol
+    tier = Column(String)               # "1m", "1h", "1d"
+    bucket = Column(DateTime, index=True)  # bucket start (UTC)
+    open = Column(Float)
+    high = Column(Float)
+    low = Column(Float)
+    close = Column(Float)
 
+# 📧 Email Outbox (delivered by background workers, survives restarts)
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    to_addr = Column(String)
+    subject = Column(String)
+    template = Column(String)
+    context = Column(String, nullable=True)        # JSON; cleared once sent (holds the OTP)
+    status = Column(String, default="pending", index=True)  # pending / sending / sent / failed / expired
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)
+    claim_token = Column(String, nullable=True, index=True)
+    locked_until = Column(DateTime, nullable=True)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    expires_at = Column(DateTime, nullable=True)   # drop instead of sending after this (OTP rows)
 
+# 🔔 Per-user price alerts (evaluated on every market update by alerts.py)
+class PriceAlert(Base):
+    __tablename__ = "price_alerts"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, index=True)
+    instrument = Column(String)            # "pt" / "pd" / "rh" or ticker symbol
+    kind = Column(String)                  # "above" / "below" (one-shot) or "change_pct" (re-arms)
+    value = Column(Float)                  # target price, or percent move for change_pct
+    reference = Column(Float, nullable=True)   # change_pct: price the move is measured from
+    active = Column(Boolean, default=True)
+    triggered_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, index=True)
@@ -0,0 +1,157 @@
+import asyncio
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert
+
+from database import SessionLocal
+from models import PriceBar
+
+# ==========================================================
+# 🗄️ PRICE HISTORY STORE (OHLC rollups: 1m / 1h / 1d)
+# ==========================================================
+# Every market update is folded into the open bucket of each tier in memory.
+# A flush task bulk-writes closed bars (append-only) and upserts the
+# still-open ones every HISTORY_FLUSH_SECONDS, so /history reads straight
+# from the tier tables and a restart picks up today's open bars, including
+# the session opening prices. Only the market leader records and flushes;
+# followers get its open bars through the shared snapshot (shared_state.py),
+# so every worker's /history ends on the same live bar.
+
+TIERS = {"1m": 60, "1h": 3600, "1d": 86400}
+RETENTION = {"1m": timedelta(days=7), "1h": timedelta(days=180), "1d": None}
+FLUSH_SECONDS = float(os.getenv("HISTORY_FLUSH_SECONDS", "60"))
+PRUNE_EVERY_SECONDS = 3600
+
+
+def _bucket_start(ts, secs):
+    return int(ts // secs * secs)
+
+
+def _to_dt(ts):
+    # Stored as naive UTC, like the rest of the models
+    return datetime.fromtimestamp(ts, tz=timezone.utc).replace(tzinfo=None)
+
+
+def _to_ts(dt):
+    return int(dt.replace(tzinfo=timezone.utc).timestamp())
+
+
+class PriceHistory:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._open = {}      # (name, tier) -> [bucket_ts, open, high, low, close]
+        self._closed = []    # finished bars awaiting insert
+        self._last_prune = 0.0
+
+    def record(self, prices, ts=None):
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            for name, price in prices.items():
+                if not price: continue
+                for tier, secs in TIERS.items():
+                    bucket = _bucket_start(ts, secs)
+                    bar = self._open.get((name, tier))
+                    if bar is None or bar[0] != bucket:
+                        if bar is not None: self._closed.append((name, tier, bar))
+                        self._open[(name, tier)] = [bucket, price, price, price, price]
+                    else:
+                        if price > bar[2]: bar[2] = price
+                        if price < bar[3]: bar[3] = price
+                        bar[4] = price
+
+    @staticmethod
+    def _row(name, tier, bar):
+        return {"name": name, "tier": tier, "bucket": _to_dt(bar[0]), "open": bar[1], "high": bar[2], "low": bar[3], "close": bar[4]}
+
+    def flush(self):
+        with self._lock:
+            closed, self._closed = self._closed, []
+            open_bars = [(name, tier, list(bar)) for (name, tier), bar in self._open.items()]
+        rows = [self._row(*b) for b in closed + open_bars]
+        if not rows: return 0
+
+        # Group upsert keys by (tier, bucket) so the delete is one portable IN per group
+        groups = {}
+        for r in rows: groups.setdefault((r["tier"], r["bucket"]), set()).add(r["name"])
+
+        db = SessionLocal()
+        try:
+            for (tier, bucket), names in groups.items():
+                db.execute(delete(PriceBar).where(PriceBar.tier == tier, PriceBar.bucket == bucket, PriceBar.name.in_(names)))
+            db.execute(insert(PriceBar), rows)
+            if time.time() - self._last_prune > PRUNE_EVERY_SECONDS:
+                now = datetime.utcnow()
+                for tier, keep in RETENTION.items():
+                    if keep: db.execute(delete(PriceBar).where(PriceBar.tier == tier, PriceBar.bucket < now - keep))
+                self._last_prune = time.time()
+            db.commit()
+        except Exception:
+            db.rollback()
+            # Keep closed bars for the next attempt; open bars are re-sent anyway
+            with self._lock: self._closed = closed + self._closed
+            raise
+        finally:
+            db.close()
+        return len(rows)
+
+    def open_bars(self):
+        with self._lock: return [[name, tier, *bar] for (name, tier), bar in self._open.items()]
+
+    def load_open(self, bars):
+        """Follower side: replace the open bars with the leader's (never flushed here)."""
+        with self._lock: self._open = {(name, tier): list(bar) for name, tier, *bar in bars}
+
+    def restore(self, opening_prices, placeholders=None):
+        """Reload the currently open buckets and today's opening prices.
+
+        Bars that opened on a `placeholders` value (name -> price; written
+        before a real price existed) are skipped, so they can't seed an open.
+        """
+        placeholders = placeholders or {}
+        now = time.time()
+        db = SessionLocal()
+        try:
+            for tier, secs in TIERS.items():
+                bucket = _to_dt(_bucket_start(now, secs))
+                for bar in db.query(PriceBar).filter(PriceBar.tier == tier, PriceBar.bucket == bucket):
+                    if bar.name in placeholders and bar.open == placeholders[bar.name]: continue
+                    with self._lock:
+                        self._open.setdefault((bar.name, tier), [_to_ts(bar.bucket), bar.open, bar.high, bar.low, bar.close])
+        finally:
+            db.close()
+        for code in opening_prices:
+            bar = self._open.get((code, "1d"))
+            if bar and opening_prices[code] is None:
+                opening_prices[code] = bar[1]
+                print(f"✅ Restored Opening {code.upper()}: {bar[1]}")
+
+    def query(self, db, name, tier, start=None, end=None, limit=500):
+        q = db.query(PriceBar).filter(PriceBar.name == name, PriceBar.tier == tier)
+        if start is not None: q = q.filter(PriceBar.bucket >= start)
+        if end is not None: q = q.filter(PriceBar.bucket <= end)
+        bars = {b.bucket: (b.open, b.high, b.low, b.close) for b in q.order_by(PriceBar.bucket.desc()).limit(limit)}
+
+        # The in-memory open bar is newer than whatever was last flushed
+        with self._lock: live = self._open.get((name, tier))
+        if live is not None:
+            bucket = _to_dt(live[0])
+            if (start is None or bucket >= start) and (end is None or bucket <= end):
+                bars[bucket] = tuple(live[1:])
+
+        return [
+            {"t": bucket.isoformat() + "Z", "o": o, "h": h, "l": l, "c": c}
+            for bucket, (o, h, l, c) in sorted(bars.items())[-limit:]
+        ]
+
+    async def run_flusher(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(FLUSH_SECONDS)
+            try: await loop.run_in_executor(None, self.flush)
+            except Exception as e: print(f"History Flush Error: {e}")
+
+
+HISTORY = PriceHistory()
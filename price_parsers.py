@@ -0,0 +1,98 @@
+import asyncio
+import html as html_lib
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+# ==========================================================
+# 🧩 PRICE EXTRACTION LAYER (Targeted extractors + soup fallback)
+# ==========================================================
+# Each source type has an ordered list of extractors (html -> price string).
+# Cheap precompiled-regex extractors run first; the strained BeautifulSoup
+# parse only runs if they all miss. Parsing happens in PARSE_EXECUTOR, never
+# on the event loop.
+
+try:
+    import lxml  # noqa: F401
+    SOUP_PARSER = "lxml"
+except ImportError:
+    SOUP_PARSER = "html.parser"
+
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", "2"))
+PARSE_EXECUTOR = ThreadPoolExecutor(max_workers=PARSE_WORKERS, thread_name_prefix="html-parse")
+
+_TAG_RE = re.compile(r"<[^>]+>")
+_KITCO_H3_RE = re.compile(r"<h3\b[^>]*?\bclass=([\"'])(.*?)\1[^>]*>(.*?)</h3>", re.S | re.I)
+_SPAN_TEXT_RE = re.compile(r"<span\b[^>]*>([^<]*)</span>", re.I)
+_BACKUP_TD_RE = re.compile(r"<td\b[^>]*?\bid=([\"'])spot-price\1[^>]*>(.*?)</td>", re.S | re.I)
+_BACKUP_SPAN_RE = re.compile(r"<span\b[^>]*?\bclass=([\"'])(?:[^\"']*\s)?price-now(?:\s[^\"']*)?\1[^>]*>(.*?)</span>", re.S | re.I)
+
+
+def _text(fragment):
+    return html_lib.unescape(_TAG_RE.sub("", fragment))
+
+
+# --- 1. TARGETED (REGEX) EXTRACTORS ---
+def regex_kitco(html):
+    for m in _KITCO_H3_RE.finditer(html):
+        classes = m.group(2)
+        if "font-mulish" in classes and "text-4xl" in classes: return _text(m.group(3))
+    for m in _SPAN_TEXT_RE.finditer(html):
+        text = html_lib.unescape(m.group(1))
+        if "$" in text and len(text) < 15: return text
+    return None
+
+
+def regex_backup(html):
+    m = _BACKUP_TD_RE.search(html) or _BACKUP_SPAN_RE.search(html)
+    return _text(m.group(2)) if m else None
+
+
+# --- 2. FULL SOUP FALLBACK (Original logic, strained to the tags it reads) ---
+def soup_kitco(html):
+    soup = BeautifulSoup(html, SOUP_PARSER, parse_only=SoupStrainer(["h3", "span"]))
+    tag = soup.find("h3", class_=lambda c: c and "font-mulish" in c and "text-4xl" in c)
+    if tag: return tag.get_text()
+    for t in soup.find_all("span", string=lambda t: t and "$" in t):
+        if len(t.text) < 15: return t.text
+    return None
+
+
+def soup_backup(html):
+    soup = BeautifulSoup(html, SOUP_PARSER, parse_only=SoupStrainer(["td", "span"]))
+    tag = soup.find("td", {"id": "spot-price"})
+    if not tag: tag = soup.find("span", class_="price-now")
+    return tag.get_text() if tag else None
+
+
+EXTRACTORS = {
+    "kitco": [regex_kitco, soup_kitco],
+    "backup": [regex_backup, soup_backup],
+}
+
+
+def register_extractor(source_type, fn, first=True):
+    chain = EXTRACTORS.setdefault(source_type, [])
+    chain.insert(0, fn) if first else chain.append(fn)
+
+
+def to_price(price_str):
+    if not price_str: return None
+    clean = price_str.replace("$", "").replace(",", "").strip()
+    try: return float(clean)
+    except ValueError: return None
+
+
+def parse_price(html, source_type):
+    for extract in EXTRACTORS.get(source_type, []):
+        try: price = to_price(extract(html))
+        except Exception: price = None
+        if price: return price
+    return None
+
+
+async def parse_price_async(html, source_type):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(PARSE_EXECUTOR, parse_price, html, source_type)
@@ -0,0 +1,64 @@
+import numpy as np
+
+# ==========================================================
+# 🧮 BATCH PAYOUT ENGINE (Vectorized over the converter catalog)
+# ==========================================================
+
+TROY_OUNCE_GRAMS = 31.1035
+DEFAULT_USD_RATE = 86.5
+
+
+def price_batch(weight, pt, pd, rh, conf, spot_prices, usd_rate, currency="USD",
+                margin=None, days=None, factor=None):
+    """Price many converters in one pass.
+
+    `weight`, `pt`, `pd` and `rh` are equal-length column arrays (kg / ppm).
+    `conf` is one AppConfig snapshot and `spot_prices` one {"pt","pd","rh"}
+    snapshot, so every row is priced against the same inputs.
+    """
+    c_margin = margin if margin is not None else conf.default_margin
+    c_days = days if days is not None else conf.default_days_out
+    c_factor = factor if factor is not None else conf.factor_converter
+
+    rates = np.array([spot_prices.get("pt", 0.0), spot_prices.get("pd", 0.0), spot_prices.get("rh", 0.0)], dtype=np.float64) * c_factor
+
+    # Missing catalog values (NULL columns) price as zero instead of NaN
+    w = np.nan_to_num(np.asarray(weight, dtype=np.float64))
+    ppm = np.nan_to_num(np.column_stack([
+        np.asarray(pt, dtype=np.float64),
+        np.asarray(pd, dtype=np.float64),
+        np.asarray(rh, dtype=np.float64),
+    ]))
+
+    # (n, 3) payout per metal before interest
+    oz = (ppm / 1000) * w[:, None] / TROY_OUNCE_GRAMS
+    payout = oz * rates * (c_margin / 100)
+
+    if c_days > 0:
+        interest_rates = np.array([conf.interest_pt, conf.interest_pd, conf.interest_rh], dtype=np.float64) / 100 * (c_days / 365)
+    else:
+        interest_rates = np.zeros(3)
+
+    total_interest = payout @ interest_rates
+    final = payout.sum(axis=1) - total_interest
+
+    if currency == "INR":
+        final = final * usd_rate
+        total_interest = total_interest * usd_rate
+
+    return {
+        "final_price": np.round(final, 2),
+        "interest": np.round(total_interest, 2),
+        "rates": {"pt": float(rates[0]), "pd": float(rates[1]), "rh": float(rates[2])},
+        "usd_rate": usd_rate,
+        "params": {"margin": c_margin, "days": c_days, "factor": c_factor},
+    }
+
+
+def resolve_usd_rate(cache, custom_usd=0.0):
+    if custom_usd > 0.1: return custom_usd
+    return cache.get('data', {}).get('raw', {}).get("usd_rate", DEFAULT_USD_RATE)
+
+
+def spot_snapshot(cache):
+    return dict(cache.get('pgm_prices', {"pt": 0, "pd": 0, "rh": 0}))
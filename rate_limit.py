@@ -0,0 +1,213 @@
+import ipaddress
+import json
+import math
+import os
+import threading
+import time
+
+from fastapi import HTTPException
+
+from metrics import Counter
+
+# ==========================================================
+# 🚦 RATE LIMITER (OTP resend cooldowns + per-IP sliding window)
+# ==========================================================
+# Checked before the endpoint touches the DB, so rejected requests cost a
+# dict lookup instead of a SELECT + commit, and a bot cycling through
+# random emails is cut off by its IP budget before any ghost user row is
+# inserted. State lives in a pluggable backend: in-process memory by
+# default (per worker), or Redis when RATE_LIMIT_REDIS_URL is set so every
+# worker shares the same counters.
+
+# After the n-th OTP for an email, the next one needs this many seconds.
+# (1, 60): wait 1 min after the first, (2, 300): 5 min from the second,
+# (5, 1800): 30 min after the fifth, then the count starts over.
+OTP_RESEND_TIERS = json.loads(os.getenv("OTP_RESEND_TIERS", "[[1, 60], [2, 300], [5, 1800]]"))
+OTP_IP_LIMIT = int(os.getenv("OTP_IP_LIMIT", "10"))
+OTP_IP_WINDOW = int(os.getenv("OTP_IP_WINDOW", "600"))
+# Only honour X-Forwarded-For behind a proxy we run; otherwise a client can
+# rotate the header to dodge its IP budget
+TRUST_PROXY = os.getenv("RATE_LIMIT_TRUST_PROXY", "0") == "1"
+TRUSTED_PROXIES = [
+    ipaddress.ip_network(net.strip(), strict=False)
+    for net in os.getenv("RATE_LIMIT_TRUSTED_PROXIES", "127.0.0.0/8,::1/128,10.0.0.0/8,172.16.0.0/12,192.168.0.0/16").split(",")
+    if net.strip()
+]
+
+RATE_LIMITED = Counter("rate_limited_total", "Requests rejected by the rate limiter", ("scope", "reason"))
+
+
+# --- 1. BACKENDS ---
+class MemoryBackend:
+    """Process-local store with per-key expiry."""
+    SWEEP_EVERY = 1000
+
+    def __init__(self):
+        self._data = {}   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def _sweep(self, now):
+        self._data = {k: v for k, v in self._data.items() if v[0] > now}
+
+    async def get(self, key):
+        item = self._data.get(key)
+        if item is None or item[0] <= time.time(): return None
+        return item[1]
+
+    def _wrote(self, now):
+        # Amortized expiry sweep, so keys from one-off clients don't pile up
+        self._writes += 1
+        if self._writes % self.SWEEP_EVERY == 0: self._sweep(now)
+
+    async def set(self, key, value, ttl):
+        now = time.time()
+        with self._lock:
+            self._data[key] = (now + ttl, value)
+            self._wrote(now)
+
+    async def incr(self, key, ttl):
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            count = (item[1] if item and item[0] > now else 0) + 1
+            self._data[key] = (item[0] if item and item[0] > now else now + ttl, count)
+            self._wrote(now)
+            return count
+
+    async def delete(self, key):
+        with self._lock: self._data.pop(key, None)
+
+
+class RedisBackend:
+    def __init__(self, url):
+        import redis.asyncio as redis
+        self._r = redis.from_url(url)
+
+    async def get(self, key):
+        raw = await self._r.get(key)
+        return None if raw is None else json.loads(raw)
+
+    async def set(self, key, value, ttl):
+        await self._r.set(key, json.dumps(value), ex=max(1, int(math.ceil(ttl))))
+
+    async def incr(self, key, ttl):
+        pipe = self._r.pipeline()
+        pipe.incr(key)
+        pipe.expire(key, max(1, int(math.ceil(ttl))), nx=True)
+        count, _ = await pipe.execute()
+        return count
+
+    async def delete(self, key):
+        await self._r.delete(key)
+
+
+def default_backend():
+    url = os.getenv("RATE_LIMIT_REDIS_URL")
+    if url:
+        try: return RedisBackend(url)
+        except ImportError: print("⚠️ redis not installed; rate limits are per-process")
+    return MemoryBackend()
+
+
+# --- 2. POLICIES ---
+class CooldownPolicy:
+    """Tiered resend cooldown keyed by email."""
+
+    def __init__(self, backend, tiers):
+        self.backend = backend
+        self.tiers = sorted(tuple(t) for t in tiers)
+
+    def _cooldown(self, attempts):
+        wait = 0
+        for threshold, seconds in self.tiers:
+            if attempts >= threshold: wait = seconds
+        return wait
+
+    async def retry_after(self, key, now=None):
+        """(seconds to wait, whether the longest cooldown applies)"""
+        state = await self.backend.get(key)
+        if not state: return 0, False
+        attempts, last = state
+        now = time.time() if now is None else now
+        return max(0.0, last + self._cooldown(attempts) - now), attempts >= self.tiers[-1][0]
+
+    async def hit(self, key, now=None):
+        now = time.time() if now is None else now
+        state = await self.backend.get(key)
+        attempts = state[0] if state else 0
+        # Served the longest cooldown: start the count over
+        if attempts >= self.tiers[-1][0]: attempts = 0
+        await self.backend.set(key, [attempts + 1, now], ttl=self.tiers[-1][1])
+
+    async def reset(self, key):
+        await self.backend.delete(key)
+
+
+class SlidingWindow:
+    """Approximate sliding window: current bucket + weighted previous bucket."""
+
+    def __init__(self, backend, limit, window):
+        self.backend, self.limit, self.window = backend, limit, window
+
+    async def hit(self, key, now=None):
+        """Count one request; returns seconds to wait if over the limit, else 0."""
+        now = time.time() if now is None else now
+        bucket = int(now // self.window)
+        count = await self.backend.incr(f"{key}:{bucket}", ttl=self.window * 2)
+        prev = await self.backend.get(f"{key}:{bucket - 1}") or 0
+        elapsed = now - bucket * self.window
+        estimate = prev * (1 - elapsed / self.window) + count
+        if estimate <= self.limit: return 0
+        return self.window - elapsed
+
+
+# --- 3. OTP LIMITER ---
+def _trusted(ip):
+    try: addr = ipaddress.ip_address(ip)
+    except ValueError: return False
+    return any(addr in net for net in TRUSTED_PROXIES)
+
+
+def client_ip(request):
+    peer = request.client.host if request.client else "unknown"
+    if not TRUST_PROXY or not _trusted(peer): return peer
+    hops = [h.strip() for h in request.headers.get("x-forwarded-for", "").split(",") if h.strip()]
+    # Walk back from our side: the first hop not added by a trusted proxy is the
+    # client; anything left of it is client-supplied and can be forged
+    for hop in reversed(hops):
+        if not _trusted(hop): return hop
+    return hops[0] if hops else peer
+
+
+def _too_many(scope, reason, wait, detail):
+    RATE_LIMITED.inc(scope, reason)
+    raise HTTPException(status_code=429, detail=detail, headers={"Retry-After": str(int(math.ceil(wait)))})
+
+
+class OTPLimiter:
+    def __init__(self, backend=None, tiers=OTP_RESEND_TIERS, ip_limit=OTP_IP_LIMIT, ip_window=OTP_IP_WINDOW):
+        self.backend = backend or default_backend()
+        self.cooldown = CooldownPolicy(self.backend, tiers)
+        self.ip_window = SlidingWindow(self.backend, ip_limit, ip_window)
+
+    async def check(self, scope, email, ip):
+        """Raise 429 if this email or IP must wait. Counts the request against the IP."""
+        wait = await self.ip_window.hit(f"rl:ip:{scope}:{ip}")
+        if wait: _too_many(scope, "ip", wait, "Too many requests. Please try again later.")
+
+        wait, maxed = await self.cooldown.retry_after(f"rl:otp:{email}")
+        if wait:
+            if maxed: detail = f"Too many attempts. Try again after {int(math.ceil(wait / 60))} minutes."
+            elif wait < 60: detail = f"Please wait {int(math.ceil(wait))} seconds before resending."
+            else: detail = f"Please wait {int(math.ceil(wait / 60))} minutes before resending."
+            _too_many(scope, "email", wait, detail)
+
+    async def sent(self, email):
+        await self.cooldown.hit(f"rl:otp:{email}")
+
+    async def reset(self, email):
+        await self.cooldown.reset(f"rl:otp:{email}")
+
+
+OTP_LIMITER = OTPLimiter()
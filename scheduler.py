@@ -1,11 +1,12 @@
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import firebase_admin
-from firebase_admin import credentials, messaging
+from firebase_admin import credentials
 import time
 import asyncio
 import os   # <--- Added
 import json # <--- Added
 from market_data import CACHE, OPENING_PRICES # (Maine dot hata diya relative import ka)
+from fcm_dispatcher import FCM
 
 # Global State for Scheduler
 LAST_KNOWN_PRICES = {"rh": 0, "pd": 0, "pt": 0}
@@ -76,14 +77,8 @@ async def check_prices_job():
                 print(f"🚀 Alert Sent: {title}")
 
 async def send_fcm_alert(title, body):
-    try:
-        msg = messaging.Message(
-            notification=messaging.Notification(title=title, body=body),
-            topic="all_users"
-        )
-        messaging.send(msg)
-    except Exception as e:
-        print(f"Failed to send FCM: {e}")
+    # Queued; the dispatcher sends in batches off the event loop and retries
+    FCM.send(title, body, topic="all_users")
 
 # scheduler instance
 scheduler = AsyncIOScheduler()
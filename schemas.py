@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from typing import Literal
+from pydantic import BaseModel, Field
 
 class Token(BaseModel):
     access_token: str
@@ -28,3 +29,12 @@ class ConfigUpdate(BaseModel):
     factor_calculator: float
     factor_converter: float
     factor_market: float
+
+# 🔔 Price Alerts
+class AlertCreate(BaseModel):
+    instrument: str
+    kind: Literal["above", "below", "change_pct"]
+    value: float = Field(gt=0)
+
+class DeviceToken(BaseModel):
+    token: str
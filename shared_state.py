@@ -0,0 +1,171 @@
+import asyncio
+import fcntl
+import mmap
+import os
+import struct
+import tempfile
+
+import orjson
+
+import live_rates
+import market_data
+from price_history import HISTORY
+
+# ==========================================================
+# 🔒 SINGLE-PRODUCER MARKET STATE (Leader lock + shared mmap snapshot)
+# ==========================================================
+# Only the worker holding LOCK_PATH (flock, released automatically when the
+# process dies) runs the market engine and the alert scheduler. After each
+# output rebuild it writes a snapshot into a fixed-size mmap file; the other
+# workers map it read-only, poll the sequence number, and load new
+# snapshots into their own CACHE. Followers keep retrying the lock, so one of
+# them takes over if the leader exits.
+#
+# Layout: [seq u64][length u32][payload bytes]. Seqlock protocol: the writer
+# bumps seq to odd, writes, then bumps to even; readers retry on odd or
+# changed seq.
+
+_SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+SHM_PATH = os.getenv("MARKET_SHM_PATH", os.path.join(_SHM_DIR, "sbpgm_market.mmap"))
+LOCK_PATH = SHM_PATH + ".lock"
+SHM_SIZE = int(os.getenv("MARKET_SHM_SIZE", str(1 << 20)))
+ENABLED = os.getenv("MARKET_SHARED_STATE", "1") != "0"
+POLL_SECONDS = 0.5
+LEADER_RETRY_SECONDS = 5
+
+HEADER = struct.Struct("<QI")
+
+STATE = {"role": None}   # "leader" | "follower"
+
+
+class LeaderLock:
+    def __init__(self, path=LOCK_PATH):
+        self.path = path
+        self._fd = None
+
+    def try_acquire(self):
+        if self._fd is not None: return True
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            os.close(fd)
+            return False
+        self._fd = fd
+        return True
+
+
+class SnapshotWriter:
+    def __init__(self, path=SHM_PATH, size=SHM_SIZE):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            self._mm = mmap.mmap(fd, size, access=mmap.ACCESS_WRITE)
+        finally:
+            os.close(fd)
+        self._seq = HEADER.unpack_from(self._mm, 0)[0]
+        if self._seq % 2: self._seq += 1   # previous leader died mid-write
+
+    def write(self, payload):
+        if HEADER.size + len(payload) > len(self._mm):
+            print(f"⚠️ Market snapshot too large for shared segment ({len(payload)} bytes)")
+            return
+        HEADER.pack_into(self._mm, 0, self._seq + 1, len(payload))
+        self._mm[HEADER.size:HEADER.size + len(payload)] = payload
+        self._seq += 2
+        HEADER.pack_into(self._mm, 0, self._seq, len(payload))
+
+
+class SnapshotReader:
+    def __init__(self, path=SHM_PATH):
+        self.path = path
+        self._mm = None
+        self.seq = 0
+
+    def _open(self):
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            size = os.fstat(fd).st_size
+            if size < HEADER.size: return False
+            self._mm = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        return True
+
+    def read_new(self):
+        """Payload bytes if a newer complete snapshot is available, else None."""
+        if self._mm is None and not self._open(): return None
+        for _ in range(5):
+            seq, length = HEADER.unpack_from(self._mm, 0)
+            if seq == self.seq or seq == 0: return None
+            if seq % 2: continue
+            payload = self._mm[HEADER.size:HEADER.size + length]
+            if HEADER.unpack_from(self._mm, 0)[0] == seq:
+                self.seq = seq
+                return payload
+        return None
+
+
+def _snapshot_payload():
+    return orjson.dumps({
+        "data": market_data.CACHE["data"],
+        "pgm_prices": market_data.CACHE["pgm_prices"],
+        "opening": market_data.OPENING_PRICES,
+        "scraped": sorted(market_data.SCRAPED_PGM),
+        "real": market_data.REAL_DATA_CACHE,
+        "history": HISTORY.open_bars(),
+    })
+
+
+def _apply_snapshot(payload):
+    snap = orjson.loads(payload)
+    # Mutate in place: other modules may hold references to these containers.
+    # CACHE["data"] alone is swapped, since live_rates tracks it by identity.
+    market_data.CACHE["pgm_prices"].clear()
+    market_data.CACHE["pgm_prices"].update(snap["pgm_prices"])
+    market_data.OPENING_PRICES.update(snap["opening"])
+    market_data.SCRAPED_PGM.clear()
+    market_data.SCRAPED_PGM.update(snap.get("scraped", ()))
+    market_data.REAL_DATA_CACHE.clear()
+    market_data.REAL_DATA_CACHE.update(snap["real"])
+    HISTORY.load_open(snap.get("history", ()))
+    market_data.CACHE["data"] = snap["data"]
+    live_rates.publish(snap["data"])
+
+
+def _become_leader(on_leader):
+    STATE["role"] = "leader"
+    if ENABLED:
+        writer = SnapshotWriter()
+        market_data.OUTPUT_HOOKS.append(lambda: writer.write(_snapshot_payload()))
+    print(f"👑 Market Engine Leader (pid {os.getpid()})")
+    on_leader()
+
+
+async def run_market_role(on_leader):
+    """Run as leader if the lock is free, otherwise follow the shared snapshot."""
+    lock = LeaderLock()
+    if not ENABLED or lock.try_acquire():
+        _become_leader(on_leader)
+        return
+
+    STATE["role"] = "follower"
+    print(f"📡 Market Engine Follower (pid {os.getpid()})")
+    reader = SnapshotReader()
+    loop = asyncio.get_running_loop()
+    next_lock_try = loop.time() + LEADER_RETRY_SECONDS
+    while True:
+        try:
+            payload = reader.read_new()
+            if payload is not None: _apply_snapshot(payload)
+        except Exception as e:
+            print(f"Snapshot Read Error: {e}")
+        if loop.time() >= next_lock_try:
+            next_lock_try = loop.time() + LEADER_RETRY_SECONDS
+            if lock.try_acquire():
+                _become_leader(on_leader)
+                return
+        await asyncio.sleep(POLL_SECONDS)
@@ -0,0 +1,91 @@
+import asyncio
+import random
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from metrics import FETCH_LATENCY, FETCH_TOTAL
+
+# ==========================================================
+# ⏱️ PER-SOURCE MARKET TASK SCHEDULER
+# ==========================================================
+# Every source runs as its own task on a fixed-rate schedule (interval ±
+# jitter, measured from the start of the previous run so slow fetches don't
+# drift), with its own timeout and retry/backoff policy. A source signals
+# `changed` only when it stored a different value, and the output stage
+# rebuilds only then.
+
+
+@dataclass
+class SourceTask:
+    name: str
+    fetch: Callable[[], Awaitable[Any]]   # returns None / empty on a miss
+    apply: Callable[[Any], bool]          # stores the value, True if inputs changed
+    interval: float
+    jitter: float = 0.0
+    timeout: float = 30.0
+    retries: int = 2
+    backoff: float = 5.0
+    backoff_max: float = 60.0
+    initial_delay: float = 0.0
+
+    # Runtime stats
+    last_success_at: float = field(default=0.0, init=False)
+    last_error: str = field(default="", init=False)
+    failures: int = field(default=0, init=False)
+
+
+class SourceScheduler:
+    def __init__(self, sources):
+        self.sources = list(sources)
+        self.changed = asyncio.Event()
+        self._tasks = []
+
+    async def _run_once(self, src):
+        for attempt in range(src.retries + 1):
+            started = time.perf_counter()
+            try:
+                value = await asyncio.wait_for(src.fetch(), src.timeout)
+                FETCH_LATENCY.observe(time.perf_counter() - started, src.name)
+                if value:
+                    FETCH_TOTAL.inc(src.name, "ok")
+                    src.last_success_at = time.time()
+                    src.last_error = ""
+                    if src.apply(value): self.changed.set()
+                    return True
+                FETCH_TOTAL.inc(src.name, "empty")
+                src.last_error = "empty result"
+            except asyncio.TimeoutError:
+                FETCH_TOTAL.inc(src.name, "timeout")
+                src.last_error = f"timeout after {src.timeout}s"
+            except Exception as e:
+                FETCH_TOTAL.inc(src.name, "error")
+                src.last_error = str(e)
+            src.failures += 1
+            if attempt < src.retries:
+                await asyncio.sleep(min(src.backoff * (2 ** attempt), src.backoff_max))
+        print(f"⚠️ Source {src.name} failed: {src.last_error}")
+        return False
+
+    async def _run_source(self, src):
+        loop = asyncio.get_running_loop()
+        if src.initial_delay: await asyncio.sleep(src.initial_delay)
+        next_run = loop.time()
+        while True:
+            await self._run_once(src)
+            next_run += src.interval + random.uniform(-src.jitter, src.jitter)
+            # A run that overshot its slot starts the next one immediately
+            next_run = max(next_run, loop.time())
+            await asyncio.sleep(next_run - loop.time())
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._run_source(src), name=f"source:{src.name}") for src in self.sources]
+        return self._tasks
+
+    async def run_output(self, build):
+        """Call `build()` once after each batch of input changes."""
+        while True:
+            await self.changed.wait()
+            self.changed.clear()
+            try: build()
+            except Exception as e: print(f"Output Build Error: {e}")
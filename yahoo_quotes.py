@@ -0,0 +1,115 @@
+import os
+from datetime import datetime, timedelta, timezone
+
+import pandas as pd
+import yfinance as yf
+
+# ==========================================================
+# 💹 YAHOO QUOTE FETCH (Last price + previous close, incremental bars)
+# ==========================================================
+# Instead of pulling 2 days of 1-minute bars per ticker every cycle:
+#   * once per UTC day, 5 daily bars give a starting price (last close) and
+#     the previous-close reference: the last close from a session before
+#     the one being quoted;
+#   * every later cycle only asks for 1-minute bars newer than the last
+#     one seen, capped at INCREMENT_LOOKBACK. A bar from a newer session
+#     than the reference was taken for (e.g. equities opening hours after
+#     the UTC-midnight refresh) triggers a fresh reference right away.
+
+INCREMENT_LOOKBACK = timedelta(minutes=int(os.getenv("YAHOO_LOOKBACK_MINUTES", "30")))
+
+# ticker -> {"prev_close", "price", "last_ts", "ref_day", "session"}
+YAHOO_STATE = {}
+
+
+def _download(tickers, **kwargs):
+    return yf.download(" ".join(tickers), group_by='ticker', progress=False, threads=False, **kwargs)
+
+
+def _frame(df, ticker, multi):
+    return (df[ticker] if multi else df).dropna()
+
+
+def _session(ts):
+    """Trading day of a bar, in the exchange's own timezone (as yfinance indexes it)."""
+    return ts.date()
+
+
+def _refresh_reference(tickers, today):
+    """Reset price/prev_close from daily bars; returns the tickers that were updated."""
+    df = _download(tickers, period="5d", interval="1d")
+    done = set()
+    for t in tickers:
+        try:
+            data = _frame(df, t, len(tickers) > 1)
+            if data.empty: continue
+            closes = data['Close']
+            days = closes.index.date
+            session = days[-1]
+            # Last close of an earlier session; the live bar can appear twice
+            earlier = closes[days < session]
+            st = YAHOO_STATE.setdefault(t, {"last_ts": None})
+            st["prev_close"] = float(earlier.iloc[-1] if len(earlier) else closes.iloc[-1])
+            st["price"] = float(closes.iloc[-1])
+            st["session"] = session
+            st["ref_day"] = today
+            done.add(t)
+        except: pass
+    return done
+
+
+def _fetch_increment(tickers, now):
+    """Update prices from new 1-minute bars.
+
+    Returns {ticker: (new session, price, last price of the old session)}
+    for tickers whose bars moved into a newer session.
+    """
+    floor = pd.Timestamp(now - INCREMENT_LOOKBACK)
+    seen = [YAHOO_STATE[t]["last_ts"] for t in tickers if YAHOO_STATE[t].get("last_ts") is not None]
+    since = max(min(seen), floor) if seen else floor
+    df = _download(tickers, start=since.to_pydatetime(), interval="1m")
+    rolled = {}
+    for t in tickers:
+        try:
+            data = _frame(df, t, len(tickers) > 1)
+            if data.empty: continue
+            st = YAHOO_STATE[t]
+            old_price, session = st["price"], _session(data.index[-1])
+            st["price"] = float(data['Close'].iloc[-1])
+            st["last_ts"] = data.index[-1].tz_convert("UTC") if data.index.tz is not None else data.index[-1].tz_localize("UTC")
+            if st.get("session") is not None and session > st["session"]: rolled[t] = (session, st["price"], old_price)
+        except: pass
+    return rolled
+
+
+def fetch_yahoo_quotes(tickers):
+    now = datetime.now(timezone.utc)
+    today = now.date()
+    stale = [t for t in tickers if YAHOO_STATE.get(t, {}).get("ref_day") != today]
+    fresh = [t for t in tickers if t not in stale]
+    try:
+        if stale: _refresh_reference(stale, today)
+    except: pass
+    try:
+        rolled = _fetch_increment(fresh, now) if fresh else {}
+    except: rolled = {}
+    try:
+        # New session opened: the previous session's close is now the reference
+        refreshed = _refresh_reference(list(rolled), today) if rolled else set()
+    except: refreshed = set()
+    for t, (session, price, old_price) in rolled.items():
+        st = YAHOO_STATE[t]
+        if st["session"] < session:
+            # Daily bars don't show the new session yet: their last close is the
+            # previous session's; without them, the last price we quoted for it
+            st["prev_close"] = st["price"] if t in refreshed else old_price
+            st["session"] = session
+        st["price"] = price
+
+    res = {}
+    for t in tickers:
+        st = YAHOO_STATE.get(t)
+        if not st or not st.get("prev_close"): continue
+        p, prev = st["price"], st["prev_close"]
+        res[t] = {'price': p, 'change': p - prev, 'percent': ((p - prev) / prev) * 100}
+    return res